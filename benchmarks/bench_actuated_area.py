@@ -0,0 +1,80 @@
+'''
+Compare per-call latency of :meth:`dmf_device.DmfDevice.actuated_area` with
+the previous implementation, which looked up actuated electrodes and their
+areas by label, on generated grid devices.
+
+Usage::
+
+    python benchmarks/bench_actuated_area.py [--sizes 10x12 100x100]
+'''
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+import numpy as np
+
+from dmf_device import DmfDevice
+from grid_device import grid_svg
+
+
+def actuated_area_lookup(device, state_of_all_channels):
+    '''
+    Previous implementation of :meth:`dmf_device.DmfDevice.actuated_area`
+    (using ``.loc`` in place of the deprecated ``.ix``).
+
+    Electrodes connected to several actuated channels are counted once per
+    channel.
+    '''
+    if state_of_all_channels.max() == 0:
+        return 0
+    actuated_channels_index = np.where(state_of_all_channels > 0)[0]
+    actuated_electrodes = (device.electrodes_by_channel
+                           .loc[actuated_channels_index])
+    return device.electrode_areas.loc[actuated_electrodes.values].sum()
+
+
+def main(sizes, shared_every, fraction, number):
+    random_state = np.random.RandomState(0)
+    directory = tempfile.mkdtemp()
+    try:
+        for columns, rows in sizes:
+            svg_path = grid_svg(os.path.join(directory, 'device.svg'),
+                                columns, rows, shared_every=shared_every)
+            device = DmfDevice(svg_path, name='grid')
+            channel_count = device.max_channel() + 1
+            state = (random_state.rand(channel_count) <
+                     fraction).astype(float)
+
+            # Each actuated electrode is counted once.
+            actuated = device.electrodes_by_channel.loc[np.where(state)[0]]
+            expected = device.electrode_areas.loc[actuated.unique()].sum()
+            assert np.isclose(device.actuated_area(state), expected)
+
+            print('%d channels, %d actuated' % (channel_count, state.sum()))
+            for name, function in (('lookup', actuated_area_lookup),
+                                   ('vector', DmfDevice.actuated_area)):
+                duration = min(timeit.repeat(lambda: function(device, state),
+                                             number=number, repeat=3))
+                print('  %-8s %10.1f us/call' % (name,
+                                                 1e6 * duration / number))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark '
+                                     '`DmfDevice.actuated_area`.')
+    parser.add_argument('--sizes', nargs='+', default=['10x12', '100x100'],
+                        help='Grid sizes, as `<columns>x<rows>`.')
+    parser.add_argument('--shared-every', type=int, default=20,
+                        help='Connect every n-th electrode to two channels.')
+    parser.add_argument('--fraction', type=float, default=.1,
+                        help='Fraction of channels actuated.')
+    parser.add_argument('--number', type=int, default=1000,
+                        help='Calls per timing run.')
+    args = parser.parse_args()
+    main([tuple(map(int, size.split('x'))) for size in args.sizes],
+         args.shared_every, args.fraction, args.number)
@@ -0,0 +1,78 @@
+'''
+Compare :func:`dmf_device.extract_channels` with the previous implementation,
+which built the channel frame one electrode at a time, on a generated grid
+device.
+
+Usage::
+
+    python benchmarks/bench_extract_channels.py [--columns 200] [--rows 250]
+'''
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+import pandas as pd
+
+from dmf_device import ELECTRODES_XPATH, extract_channels
+from dmf_device.svg import parse_svg, shapes_to_df
+from grid_device import grid_svg
+
+
+def extract_channels_loop(df_shapes):
+    '''
+    Previous implementation of :func:`dmf_device.extract_channels`.
+    '''
+    frames = []
+
+    if 'data-channels' in df_shapes:
+        shape_channel_lists = (df_shapes
+                               .drop_duplicates(subset=['id', 'data-channels'])
+                               .set_index('id')['data-channels']
+                               .str.split(',').dropna())
+
+        for shape_i, channels_i in zip(shape_channel_lists.index,
+                                       shape_channel_lists.values):
+            frames.extend([[shape_i, int(channel)] for channel in channels_i])
+
+    if frames:
+        df_channels = pd.DataFrame(frames, columns=['electrode_id', 'channel'])
+    else:
+        df_channels = pd.DataFrame(None, columns=['electrode_id', 'channel'])
+    df_channels['channel'] = df_channels['channel'].astype(int)
+    return df_channels
+
+
+def main(columns, rows, shared_every, repeat):
+    directory = tempfile.mkdtemp()
+    try:
+        svg_path = grid_svg(os.path.join(directory, 'device.svg'), columns,
+                            rows, shared_every=shared_every)
+        df_shapes = shapes_to_df(parse_svg(svg_path), xpath=ELECTRODES_XPATH)
+    finally:
+        shutil.rmtree(directory)
+
+    df_loop = extract_channels_loop(df_shapes)
+    df_vectorized = extract_channels(df_shapes)
+    assert (df_loop.values == df_vectorized.values).all()
+    print('%d electrodes, %d channel mappings' % (columns * rows,
+                                                  df_loop.shape[0]))
+    for name, function in (('loop', extract_channels_loop),
+                           ('vectorized', extract_channels)):
+        duration = min(timeit.repeat(lambda: function(df_shapes),
+                                     number=1, repeat=repeat))
+        print('%-10s %8.3f s' % (name, duration))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark '
+                                     '`extract_channels`.')
+    parser.add_argument('--columns', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=250)
+    parser.add_argument('--shared-every', type=int, default=5,
+                        help='Connect every n-th electrode to two channels.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main(args.columns, args.rows, args.shared_every, args.repeat)
@@ -0,0 +1,115 @@
+'''
+Compare writing a device drawing with :meth:`dmf_device.DmfDevice.save` to
+writing the string returned by :meth:`dmf_device.DmfDevice.to_svg`, on a
+generated grid device with modified electrode channels.
+
+Reports throughput (bytes written per second) and, on Python 3, the peak
+memory allocated by Python while writing (see :mod:`tracemalloc`; memory
+allocated by ``lxml`` itself is not included).
+
+Usage::
+
+    python benchmarks/bench_save.py [--columns 100] [--rows 100]
+'''
+from __future__ import print_function
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import timeit
+
+from dmf_device import DmfDevice
+from grid_device import grid_svg
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.
+    tracemalloc = None
+
+
+def write_string(device, output_path):
+    '''
+    Write drawing by encoding the whole document as a string first.
+    '''
+    data = device.to_svg().encode('utf-8')
+    with io.open(output_path, 'wb') as output:
+        output.write(data)
+
+
+def write_stream(device, output_path):
+    '''
+    Write drawing using :meth:`dmf_device.DmfDevice.save`.
+    '''
+    device.save(output_path)
+
+
+def peak_memory(function, *args):
+    '''
+    Returns
+    -------
+    int or None
+        Peak memory allocated by Python while calling function, in bytes (or
+        ``None`` if :mod:`tracemalloc` is not available).
+    '''
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(columns, rows, modified, repeat):
+    directory = tempfile.mkdtemp()
+    try:
+        svg_path = grid_svg(os.path.join(directory, 'device.svg'), columns,
+                            rows)
+        device = DmfDevice(svg_path, name='grid')
+        # Move channels of the first electrodes, such that the written
+        # document differs from the source drawing.
+        channel_count = columns * rows
+        device.set_electrodes_channels(('electrode%d' % i,
+                                        [(i + 1) % channel_count])
+                                       for i in range(modified))
+
+        output_paths = {}
+        for name, function in (('to_svg', write_string),
+                               ('save', write_stream)):
+            output_path = os.path.join(directory, '%s.svg' % name)
+            output_paths[name] = output_path
+            function(device, output_path)
+            duration = min(timeit.repeat(lambda: function(device,
+                                                          output_path),
+                                         number=1, repeat=repeat))
+            size = os.path.getsize(output_path)
+            peak = peak_memory(function, device, output_path)
+            print('%-7s %7.3f s %8.1f MB/s %s' %
+                  (name, duration, size / duration / 1e6,
+                   '' if peak is None else
+                   '%8.1f MB peak' % (peak / 1e6)))
+
+        with io.open(output_paths['to_svg'], 'rb') as to_svg_output:
+            with io.open(output_paths['save'], 'rb') as save_output:
+                # `save` also writes an XML declaration.
+                assert (save_output.read().split(b'?>', 1)[1].strip() ==
+                        to_svg_output.read().strip())
+        print('%d electrodes, %d modified, %.1f MB written' %
+              (channel_count, modified, size / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark '
+                                     '`DmfDevice.save`.')
+    parser.add_argument('--columns', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--modified', type=int, default=300,
+                        help='Number of electrodes with modified channels.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    main(args.columns, args.rows, args.modified, args.repeat)
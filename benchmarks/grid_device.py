@@ -0,0 +1,77 @@
+'''
+Generate synthetic device drawings for benchmarks.
+'''
+from __future__ import print_function
+import argparse
+
+
+def grid_svg(path, columns, rows, shared_every=0, size=20., gap=2.):
+    '''
+    Write SVG drawing of a grid of square electrodes, where each pair of
+    neighbouring electrodes is joined by a line in the ``Connections`` layer.
+
+    Parameters
+    ----------
+    path : str
+        Output file path.
+    columns, rows : int
+        Number of electrodes per row and per column, respectively.
+    shared_every : int, optional
+        If positive, every ``shared_every``-th electrode is also connected to
+        the channel of the next electrode (i.e., the channel is shared by two
+        electrodes).
+    size, gap : float, optional
+        Width of each electrode and gap between electrodes, in pixels.
+
+    Returns
+    -------
+    str
+        Output file path.
+
+    Notes
+    -----
+    Electrode ``i`` (in column-major order) is named ``electrode<i>`` and is
+    connected to channel ``i``.
+    '''
+    pitch = size + gap
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<svg xmlns="http://www.w3.org/2000/svg" '
+             'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+             'width="%s" height="%s">' % (columns * pitch, rows * pitch),
+             '<g inkscape:label="Device" inkscape:groupmode="layer">']
+    count = columns * rows
+    for i in range(count):
+        x, y = (i // rows) * pitch, (i % rows) * pitch
+        channels = str(i)
+        if shared_every > 0 and i % shared_every == 0 and i + 1 < count:
+            channels += ',%d' % (i + 1)
+        lines.append('<path id="electrode%d" data-channels="%s" '
+                     'd="M %s,%s L %s,%s L %s,%s L %s,%s Z"/>' %
+                     (i, channels, x, y, x + size, y, x + size, y + size, x,
+                      y + size))
+    lines += ['</g>',
+              '<g inkscape:label="Connections" inkscape:groupmode="layer">']
+    for i in range(count):
+        x, y = (i // rows) * pitch + .5 * size, (i % rows) * pitch + .5 * size
+        if i + rows < count:
+            lines.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' %
+                         (x, y, x + pitch, y))
+        if (i + 1) % rows:
+            lines.append('<line x1="%s" y1="%s" x2="%s" y2="%s"/>' %
+                         (x, y, x, y + pitch))
+    lines += ['</g>', '</svg>']
+    with open(path, 'w') as output:
+        output.write('\n'.join(lines))
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=grid_svg.__doc__
+                                     .strip().splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('columns', type=int)
+    parser.add_argument('rows', type=int)
+    parser.add_argument('--shared-every', type=int, default=0)
+    args = parser.parse_args()
+    print(grid_svg(args.path, args.columns, args.rows,
+                   shared_every=args.shared_every))
@@ -16,20 +16,38 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with MicroDrop.  If not, see <http://www.gnu.org/licenses/>.
 """
+from collections import OrderedDict
+import contextlib
+import itertools
 import logging
+import math
 
-from droplet_planning.connections import get_adjacency_matrix
 from lxml import etree
-from lxml.etree import XPathEvaluator
 from path_helpers import path
-from svg_model import (INKSCAPE_NSMAP, svg_shapes_to_df, INKSCAPE_PPmm,
-                       compute_shape_centers)
-from svg_model.connections import extract_connections
+from svg_model import INKSCAPE_PPmm
 from svg_model.shapes_canvas import ShapesCanvas
 import networkx as nx
 import numpy as np
 import pandas as pd
 
+from . import cache
+from .adjacency import geometric_connections
+from .channels import ActuationAreas, ChannelIndex, ChannelMap
+from .droplets import DropletRouter
+from .dynamic_routing import LpaStar, PathPlanner
+from .geometry import polygon_geometry
+from .graph import CsrGraph, edge_codes, get_indexed_shapes
+from .lazy import invalidate, lazy_attributes, lazy_property
+from .memory import nbytes
+from .nearest import PointIndex
+from .raster import affine_matrix, label_means, rasterize_labels
+from .routing import (AStarRouter, LruCache, RoutingTable,
+                      batch_shortest_paths, edge_lengths)
+from .shapes import CompactShapes
+from .spatial import SpatialIndex
+from .svg import (ChannelsDocument, connection_lines_to_df,
+                  find_connected_shapes, parse_svg, shapes_to_df)
+
 
 logger = logging.getLogger(__name__)
 
@@ -43,14 +61,29 @@ class DeviceScaleNotSet(Exception):
 
 
 class DmfDevice(object):
+    #: Derived attributes that depend on electrode channel mappings.
+    CHANNEL_ATTRIBUTES = ('_df_electrode_channels', 'electrodes_by_channel',
+                          'channels_by_electrode', 'channel_areas',
+                          '_actuation_areas', 'channel_index')
+    #: Maximum number of paths kept in :meth:`find_path` cache.
+    PATH_CACHE_SIZE = 1024
+    #: Maximum number of images kept in :meth:`label_image` cache.
+    LABEL_IMAGE_CACHE_SIZE = 4
+
     @classmethod
-    def load(cls, svg_filepath, **kwargs):
+    def load(cls, svg_filepath, cache_dir=None, **kwargs):
         """
         Load a DmfDevice from a file.
 
         Args:
 
             filename: path to file.
+            cache_dir: directory of compiled device cache.  If set, derived
+                device state is loaded from the cache if a valid entry exists
+                for the file; otherwise, the device is loaded from the file
+                and stored in the cache.
+            routing_table: if True, build all-pairs routing table (see
+                `build_routing_table`), stored in `cache_dir` (if set).
 
         Raises:
 
@@ -58,84 +91,704 @@ class DmfDevice(object):
             FutureVersionError: file was written by a future version of the
                 software.
         """
-        return cls(svg_filepath, **kwargs)
-
-    def __init__(self, svg_filepath, name=None, **kwargs):
+        routing_table = kwargs.pop('routing_table', False)
+        if cache_dir is None:
+            device = cls(svg_filepath, **kwargs)
+            if routing_table:
+                device.build_routing_table()
+            return device
+
+        # Name, SVG tree retention, graph backend and lazy evaluation do not
+        # affect derived state, so exclude them from cache key.
+        name = kwargs.pop('name', None)
+        retain_svg_tree = kwargs.pop('retain_svg_tree', False)
+        graph_backend = kwargs.pop('graph_backend', 'networkx')
+        kwargs.pop('lazy', None)
+        key = cache.device_cache_key(svg_filepath, **kwargs)
+        state = cache.load_state(cache_dir, svg_filepath, key)
+        if state is None:
+            device = cls(svg_filepath, name=name,
+                         retain_svg_tree=retain_svg_tree,
+                         graph_backend=graph_backend, **kwargs)
+            # Cache *all* derived attributes.
+            device.materialize()
+            cache.save_state(cache_dir, svg_filepath, key,
+                             device.__getstate__())
+        else:
+            device = cls.__new__(cls)
+            device.__setstate__(state)
+            device.name = name or path(svg_filepath).namebase
+            device.svg_filepath = svg_filepath
+            device.retain_svg_tree = retain_svg_tree
+            device.graph_backend = graph_backend
+        if routing_table:
+            device.build_routing_table(cache_dir=cache_dir)
+        return device
+
+    def __init__(self, svg_filepath, name=None, retain_svg_tree=False,
+                 lazy=True, graph_backend='networkx', connections='auto',
+                 connection_tolerance=1., compact=False, **kwargs):
+        '''
+        Parameters
+        ----------
+        svg_filepath : str
+            Path to SVG device drawing.
+        name : str, optional
+            Device name (default: base name of SVG file).
+        retain_svg_tree : bool, optional
+            If ``True``, keep parsed SVG document in memory to avoid parsing
+            the SVG file again in :meth:`to_svg`, and to only update
+            electrodes modified since the previous call (at the cost of
+            memory).
+        lazy : bool, optional
+            If ``True`` (default), derived attributes (e.g., :attr:`graph`,
+            :attr:`adjacency_matrix`, :attr:`electrode_areas`) are computed on
+            first access.  Otherwise, all derived attributes are computed
+            immediately (see :meth:`materialize`).
+        graph_backend : str, optional
+            Graph used by :meth:`find_path`: either ``"networkx"`` (default)
+            to use :attr:`graph`, or ``"csr"`` to use the compact
+            :attr:`router` (which avoids building :attr:`graph`).
+        connections : str, optional
+            Source of connections between electrodes: ``"svg"`` to use the
+            lines in the ``Connections`` layer of the SVG drawing,
+            ``"geometry"`` to detect electrodes with adjacent edges (see
+            :func:`dmf_device.adjacency.geometric_connections`), or
+            ``"auto"`` (default) to use ``"svg"`` if the drawing has any
+            connection lines, and ``"geometry"`` otherwise.
+        connection_tolerance : float, optional
+            Maximum gap (in millimeters) between edges of electrodes
+            connected by ``"geometry"``.
+        compact : bool, optional
+            If ``True``, store electrode vertices in compact form (see
+            :class:`dmf_device.shapes.CompactShapes`), i.e., as single
+            precision coordinates with the attributes of each electrode stored
+            once.  :attr:`df_shapes` is then built on each access.
+        '''
+        if graph_backend not in ('networkx', 'csr'):
+            raise ValueError('Unsupported graph backend: `%s`' %
+                             graph_backend)
+        if connections not in ('auto', 'svg', 'geometry'):
+            raise ValueError('Unsupported connections source: `%s`' %
+                             connections)
         self.name = name or path(svg_filepath).namebase
 
+        # Parse SVG document *once*.  The parsed document is shared by the
+        # electrode layer, the connection layer, and (optionally) `to_svg`.
+        xml_tree = parse_svg(svg_filepath)
+
         # Read SVG paths and polygons from `Device` layer into data frame, one
         # row per polygon vertex.
-        self.df_shapes = svg_shapes_to_df(svg_filepath, xpath=ELECTRODES_XPATH)
+        self._compact_shapes = None
+        self._df_shapes = shapes_to_df(xml_tree, xpath=ELECTRODES_XPATH)
 
         # Add SVG file path as attribute.
         self.svg_filepath = svg_filepath
+        self.retain_svg_tree = retain_svg_tree
+        self._xml_tree = xml_tree if retain_svg_tree else None
+        # Retained SVG document with index of electrode shapes (see
+        # `to_svg`).
+        self._svg_document = None
         self.shape_i_columns = 'id'
+        self.graph_backend = graph_backend
+        self.connections = connections
+        self.connection_tolerance = connection_tolerance
 
-        # Create temporary shapes canvas with same scale as original shapes
-        # frame.  This canvas is used for to conduct point queries to detect
-        # which shape (if any) overlaps with the endpoint of a connection line.
-        svg_canvas = ShapesCanvas(self.df_shapes, self.shape_i_columns)
-
-        # Detect connected shapes based on lines in "Connection" layer of the
-        # SVG.
-        self.df_shape_connections = extract_connections(self.svg_filepath,
-                                                        svg_canvas)
+        # Read end points of lines in "Connections" layer of the SVG.
+        # Connected shapes are detected on first access of
+        # `df_shape_connections`.
+        df_connection_lines = connection_lines_to_df(xml_tree)
 
         # Scale coordinates to millimeter units.
-        self.df_shapes[['x', 'y']] -= self.df_shapes[['x', 'y']].min().values
+        xy_min = self.df_shapes[['x', 'y']].min().values
+        self.df_shapes[['x', 'y']] -= xy_min
         self.df_shapes[['x', 'y']] /= INKSCAPE_PPmm.magnitude
+        for x, y in (('x1', 'y1'), ('x2', 'y2')):
+            df_connection_lines[[x, y]] -= xy_min
+            df_connection_lines[[x, y]] /= INKSCAPE_PPmm.magnitude
+        self._df_connection_lines = df_connection_lines
+
+        # Area, perimeter, bounding box and centroid of each electrode,
+        # computed in one pass over all vertices.
+        self.df_electrode_geometry = polygon_geometry(self.df_shapes,
+                                                      self.shape_i_columns)
+
+        # Add center of bounding box of each electrode and offset of each
+        # vertex from center (see `svg_model.compute_shape_centers`).
+        df_geometry = (self.df_electrode_geometry
+                       .reindex(self.df_shapes[self.shape_i_columns].values))
+        self.df_shapes['x_center'] = .5 * (df_geometry['x_min'].values +
+                                           df_geometry['x_max'].values)
+        self.df_shapes['y_center'] = .5 * (df_geometry['y_min'].values +
+                                           df_geometry['y_max'].values)
+        self.df_shapes['x_center_offset'] = (self.df_shapes['x'] -
+                                             self.df_shapes['x_center'])
+        self.df_shapes['y_center_offset'] = (self.df_shapes['y'] -
+                                             self.df_shapes['y_center'])
+
+        df_electrode_channels = self.get_electrode_channels()
+        # Channels of each electrode in the SVG source, to detect modified
+        # electrodes (see `diff_electrode_channels`).
+        self._original_channels = dict(ChannelMap
+                                       .from_frame(df_electrode_channels)
+                                       .channels_by_electrode)
+        self.df_electrode_channels = df_electrode_channels
+
+        # Convert vertices to compact form *after* all per-vertex columns have
+        # been added.
+        self.compact = compact
+        if compact:
+            self.df_shapes = self._df_shapes
 
-        self.df_shapes = compute_shape_centers(self.df_shapes,
-                                               self.shape_i_columns)
-
-        self.df_electrode_channels = self.get_electrode_channels()
-
-        self.graph = nx.Graph()
-        for index, row in self.df_shape_connections.iterrows():
-            self.graph.add_edge(row['source'], row['target'])
-
-        # Get data frame, one row per electrode, indexed by electrode path id,
-        # each row denotes electrode center coordinates.
-        self.df_shape_centers = (self.df_shapes.drop_duplicates(subset=['id'])
-                                 .set_index('id')[['x_center', 'y_center']])
-        (self.adjacency_matrix, self.indexed_shapes,
-         self.shape_indexes) = get_adjacency_matrix(self.df_shape_connections)
-        self.df_indexed_shape_centers = (self.df_shape_centers
-                                         .loc[self.shape_indexes.index]
-                                         .reset_index())
-        self.df_indexed_shape_centers.rename(columns={'index': 'shape_id'},
-                                             inplace=True)
-
-        self.df_shape_connections_indexed = self.df_shape_connections.copy()
-        self.df_shape_connections_indexed['source'] = \
-            map(str, self.shape_indexes[self.df_shape_connections['source']])
-        self.df_shape_connections_indexed['target'] \
-            = map(str, self.shape_indexes[self.df_shape_connections
-                                          ['target']])
-
-        self.df_shapes_indexed = self.df_shapes.copy()
-        self.df_shapes_indexed['id'] = map(str, self.shape_indexes
-                                           [self.df_shapes['id']])
         # Modified state (`True` if electrode channels have been updated).
         self._dirty = False
+        # Nesting depth of `channel_edits` blocks.
+        self._channel_edits_depth = 0
+        # All-pairs routing table (see `build_routing_table`).
+        self.routing_table = None
+
+        if not lazy:
+            self.materialize()
+
+    @property
+    def df_shapes(self):
+        '''
+        Frame with one row per electrode vertex, with the columns ``id``,
+        ``vertex_i``, ``x``, ``y``, ``x_center``, ``y_center``,
+        ``x_center_offset``, ``y_center_offset`` and one column per attribute
+        of the SVG electrode elements (e.g., ``data-channels``).
+
+        If :attr:`compact` is set, the frame is built on each access from the
+        compact vertex storage (i.e., changes to the frame are not kept;
+        assign a modified frame instead).
+        '''
+        if self._compact_shapes is not None:
+            return self._compact_shapes.to_frame()
+        return self._df_shapes
+
+    @df_shapes.setter
+    def df_shapes(self, value):
+        if self.compact:
+            self._compact_shapes = CompactShapes.from_frame(value)
+            self._df_shapes = None
+        else:
+            self._compact_shapes = None
+            self._df_shapes = value
+
+    def __getstate__(self):
+        '''
+        Returns
+        -------
+        dict
+            Device state, including all derived attributes computed so far.
+        '''
+        state = self.__dict__.copy()
+        # Parsed SVG document cannot be pickled.
+        state['_xml_tree'] = None
+        state['_svg_document'] = None
+        # Label images are large and cheap to rasterize again.
+        state.pop('_label_images', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def materialize(self):
+        '''
+        Compute all derived attributes that have not been computed yet.
+
+        Useful to avoid a delay on first access of a derived attribute, e.g.,
+        in latency sensitive user interface code.
+        '''
+        for name in lazy_attributes(type(self)):
+            getattr(self, name)
+
+    def memory_report(self):
+        '''
+        Memory held by the device, per attribute.
+
+        Only attributes held by the device are included, i.e., derived
+        attributes that have not been computed yet (see :meth:`materialize`)
+        are omitted.  Memory shared between attributes (e.g., arrays referenced
+        by several derived attributes) is counted once, for the first
+        attribute in alphabetical order (see :func:`dmf_device.memory.nbytes`).
+
+        Returns
+        -------
+        pandas.Series
+            Number of bytes held by each attribute, indexed by attribute name
+            (in descending order).
+        '''
+        seen = set()
+        report = pd.Series(OrderedDict((name, nbytes(value, seen=seen))
+                                       for name, value in
+                                       sorted(self.__dict__.items())),
+                           name='bytes', dtype=np.int64)
+        report.index.name = 'attribute'
+        return report.sort_values(ascending=False, kind='mergesort')
+
+    def invalidate(self, names=None):
+        '''
+        Discard computed derived attributes, to be recomputed on next access.
+
+        Parameters
+        ----------
+        names : list, optional
+            Names of derived attributes to discard.  By default, all derived
+            attributes (and :attr:`routing_table`) are discarded.
+        '''
+        if names is None:
+            names = lazy_attributes(type(self))
+            self.routing_table = None
+        invalidate(self, names)
+
+    def build_routing_table(self, cache_dir=None):
+        '''
+        Precompute paths with the fewest hops between all pairs of connected
+        electrodes.
+
+        Once built, :meth:`find_path` and :meth:`hop_distance` look up paths
+        in the table instead of searching the connection graph.  Among paths
+        with the fewest hops, the path with the shortest total distance
+        between electrode centers is selected.
+
+        The table holds two square integer matrices, with one row and column
+        per connected electrode (e.g., 4 MB for 1000 electrodes).
+
+        Parameters
+        ----------
+        cache_dir : str, optional
+            Directory of compiled device cache.  If set, the table is loaded
+            from the cache if a valid entry exists for the SVG file of the
+            device; otherwise, the table is built and stored in the cache.
+
+        Returns
+        -------
+        dmf_device.routing.RoutingTable
+            Routing table (also available as :attr:`routing_table`).
+        '''
+        routing_table = None
+        if cache_dir is not None:
+            # Connection options change the connection graph, so they are
+            # part of the key.
+            key = cache.device_cache_key(
+                self.svg_filepath, connections=self.connections,
+                connection_tolerance=self.connection_tolerance)
+            routing_table = cache.load_routing_table(cache_dir,
+                                                     self.svg_filepath, key)
+        if routing_table is None:
+            routing_table = RoutingTable.from_graph(self.csr_graph,
+                                                    self.router.costs)
+            if cache_dir is not None:
+                cache.save_routing_table(cache_dir, self.svg_filepath, key,
+                                         routing_table)
+        self.routing_table = routing_table
+        return routing_table
+
+    @property
+    def df_shape_connections(self):
+        '''
+        Connections between electrodes, as a frame with the columns
+        ``source``, ``target`` and (for connections from the SVG
+        ``Connections`` layer) ``line_id``.
+
+        Assigning a frame discards all derived attributes (see
+        :meth:`invalidate`), since electrode codes, graphs and cached paths
+        depend on the connections.  Modify a copy of the frame and assign
+        it, rather than modifying the frame in place.
+        '''
+        return self._df_shape_connections
+
+    @df_shape_connections.setter
+    def df_shape_connections(self, value):
+        self.invalidate()
+        self._df_shape_connections = value
+
+    @lazy_property
+    def _df_shape_connections(self):
+        connections = self.connections
+        if connections == 'auto':
+            connections = ('svg' if self._df_connection_lines.shape[0] > 0
+                           else 'geometry')
+        if connections == 'geometry':
+            return geometric_connections(self.df_shapes,
+                                         tolerance=self.connection_tolerance,
+                                         shape_i_column=self.shape_i_columns)
+
+        # Create temporary shapes canvas with same scale as shapes frame.
+        # This canvas is used for to conduct point queries to detect which
+        # shape (if any) overlaps with the endpoint of a connection line.
+        svg_canvas = ShapesCanvas(self.df_shapes, self.shape_i_columns)
+
+        # Detect connected shapes based on lines in "Connections" layer of the
+        # SVG.
+        return find_connected_shapes(self._df_connection_lines, svg_canvas)
+
+    @property
+    def graph(self):
+        '''
+        Graph of connected electrodes, with one node per electrode identifier.
+
+        The ``distance`` attribute of each edge is the distance between the
+        centers of the connected electrodes.
+
+        Paths found by :meth:`find_path` are cached, assuming the topology of
+        the graph does not change.  Assigning a graph discards cached paths;
+        after modifying the graph in place, call :meth:`invalidate` with
+        ``['_path_cache']``.
+        '''
+        return self._graph
+
+    @graph.setter
+    def graph(self, value):
+        invalidate(self, ['_path_cache'])
+        self._graph = value
+
+    @lazy_property
+    def _graph(self):
+        sources = self.df_shape_connections['source'].values
+        targets = self.df_shape_connections['target'].values
+        centers = self.df_shape_centers
+        distances = edge_lengths(centers.values,
+                                 centers.index.get_indexer(sources),
+                                 centers.index.get_indexer(targets))
+        graph = nx.Graph()
+        graph.add_edges_from((source, target, {'distance': distance})
+                             for source, target, distance in
+                             zip(sources.tolist(), targets.tolist(),
+                                 distances.tolist()))
+        return graph
+
+    @lazy_property
+    def csr_graph(self):
+        '''
+        Compact graph of connected electrodes, with one node per adjacency
+        matrix index (see :attr:`shape_indexes`).
+        '''
+        sources, targets = edge_codes(self.df_shape_connections,
+                                      self.indexed_shapes)
+        return CsrGraph.from_edges(sources, targets,
+                                   self.indexed_shapes.shape[0])
+
+    @lazy_property
+    def router(self):
+        '''
+        A* shortest path search on :attr:`csr_graph`, using the distance
+        between electrode centers as edge cost.
+        '''
+        return AStarRouter(self.csr_graph,
+                           self.df_shape_centers
+                           .loc[self.indexed_shapes.values].values)
+
+    @lazy_property
+    def droplet_router(self):
+        '''
+        Prioritized multi-droplet router on :attr:`csr_graph` (see
+        :meth:`route_droplets`).
+        '''
+        return DropletRouter(self.csr_graph)
+
+    @lazy_property
+    def _path_cache(self):
+        '''
+        Most recently found paths, keyed by ``(source_id, target_id)``.
+
+        Cached paths assume an immutable connection topology.  The cache is
+        discarded when :attr:`df_shape_connections` or :attr:`graph` is
+        assigned, and by :meth:`invalidate`, but not when either is modified
+        in place.
+        '''
+        return LruCache(self.PATH_CACHE_SIZE)
+
+    @lazy_property
+    def _centers_by_id(self):
+        '''
+        Electrode center ``(x, y)`` coordinates, keyed by electrode identifier.
+        '''
+        return dict(zip(self.df_shape_centers.index,
+                        self.df_shape_centers.values.tolist()))
+
+    @lazy_property
+    def df_shape_centers(self):
+        '''
+        Data frame, one row per electrode, indexed by electrode path id, each
+        row denotes electrode center coordinates.
+        '''
+        return (self.df_shapes.drop_duplicates(subset=['id'])
+                .set_index('id')[['x_center', 'y_center']])
+
+    @lazy_property
+    def adjacency_matrix(self):
+        '''
+        Matrix where $a_{i,j} = 1$ indicates electrode $i$ is connected to
+        electrode $j$.
+        '''
+        return self.csr_graph.to_adjacency_matrix()
+
+    @lazy_property
+    def indexed_shapes(self):
+        '''
+        Electrode identifiers, indexed by adjacency matrix index.
+        '''
+        return get_indexed_shapes(self.df_shape_connections)
+
+    @lazy_property
+    def shape_indexes(self):
+        '''
+        Adjacency matrix index, indexed by electrode identifier.
+        '''
+        return pd.Series(self.indexed_shapes.index,
+                         index=self.indexed_shapes.values)
+
+    @lazy_property
+    def indexed_electrodes(self):
+        '''
+        Identifiers of *all* electrodes, indexed by electrode code.
+
+        Codes of connected electrodes match :attr:`shape_indexes`; codes of
+        electrodes without connections follow (in sorted order).
+        '''
+        unconnected = np.setdiff1d(self.df_shapes['id'].unique(),
+                                   self.indexed_shapes.values)
+        return pd.Series(np.concatenate([self.indexed_shapes.values,
+                                         unconnected]).astype(object))
+
+    @lazy_property
+    def electrode_codes(self):
+        '''
+        Electrode code, indexed by electrode identifier (see
+        :attr:`indexed_electrodes`).
+        '''
+        return pd.Series(self.indexed_electrodes.index,
+                         index=self.indexed_electrodes.values)
+
+    @lazy_property
+    def electrode_code_areas(self):
+        '''
+        Area of each electrode in square millimeters, indexed by electrode
+        code (see :attr:`indexed_electrodes`).
+        '''
+        return (self.electrode_areas.reindex(self.indexed_electrodes.values)
+                .fillna(0).values)
+
+    @lazy_property
+    def channel_index(self):
+        '''
+        Mapping between electrode codes (see :attr:`indexed_electrodes`) and
+        channels (see :class:`dmf_device.channels.ChannelIndex`).
+        '''
+        df_electrode_channels = self.df_electrode_channels
+        return ChannelIndex(self._encode(df_electrode_channels
+                                         ['electrode_id'].values),
+                            df_electrode_channels['channel'].values,
+                            self.indexed_electrodes.shape[0])
+
+    def encode_electrodes(self, electrode_ids):
+        '''
+        Translate electrode identifiers to electrode codes (see
+        :attr:`indexed_electrodes`).
+
+        Parameters
+        ----------
+        electrode_ids : array-like
+            Electrode identifiers (or :class:`pandas.Categorical`, e.g., as
+            returned by :meth:`decode_electrodes`).
+
+        Returns
+        -------
+        numpy.ndarray
+            Electrode code of each electrode.
+
+        Raises
+        ------
+        KeyError
+            If an electrode identifier is not known.
+        '''
+        codes = self._encode(electrode_ids)
+        if (codes < 0).any():
+            raise KeyError(np.asarray(electrode_ids,
+                                      dtype=object).ravel()
+                           [np.argmax(codes < 0)])
+        return codes
+
+    def decode_electrodes(self, codes):
+        '''
+        Translate electrode codes to electrode identifiers.
+
+        Parameters
+        ----------
+        codes : array-like
+            Electrode codes (see :attr:`indexed_electrodes`).  Negative codes
+            denote missing electrodes.
+
+        Returns
+        -------
+        pandas.Categorical
+            Electrode identifiers, as categorical with :attr:`electrode_codes`
+            as categories, i.e., where the categorical codes *are* the
+            electrode codes.
+        '''
+        return pd.Categorical.from_codes(np.asarray(codes).ravel(),
+                                         self.electrode_codes.index)
+
+    def _encode(self, electrode_ids):
+        '''
+        Returns
+        -------
+        numpy.ndarray
+            Electrode code of each electrode, or -1 for unknown electrodes.
+        '''
+        if (isinstance(electrode_ids, pd.Categorical) and
+                electrode_ids.categories.equals(self.electrode_codes.index)):
+            return electrode_ids.codes.astype(np.int64)
+        electrode_ids = np.asarray(electrode_ids, dtype=object).ravel()
+        return self.electrode_codes.index.get_indexer(electrode_ids)
+
+    @lazy_property
+    def spatial_index(self):
+        '''
+        Spatial index of electrode polygons, in millimeters, over electrode
+        codes (see :meth:`find_electrodes`).
+        '''
+        df_shapes = self.df_shapes
+        codes = pd.Index(self.indexed_electrodes.values)\
+            .get_indexer(df_shapes['id'].values)
+        bounding_boxes = (self.df_electrode_geometry
+                          .reindex(self.indexed_electrodes.values)
+                          [['x_min', 'y_min', 'x_max', 'y_max']].values)
+        return SpatialIndex.from_frame(df_shapes, codes,
+                                       bounding_boxes=bounding_boxes)
+
+    @lazy_property
+    def center_index(self):
+        '''
+        Nearest neighbour index of electrode centers, in millimeters, over
+        electrode codes (see :meth:`nearest_electrodes`).
+        '''
+        return PointIndex(self.df_shape_centers
+                          .reindex(self.indexed_electrodes.values).values)
+
+    @lazy_property
+    def _label_images(self):
+        '''
+        Most recently rasterized label images, keyed by image shape and
+        transform (see :meth:`label_image`).
+        '''
+        return LruCache(self.LABEL_IMAGE_CACHE_SIZE)
+
+    @property
+    def df_indexed_shape_centers(self):
+        '''
+        Center coordinates of connected electrodes, one row per adjacency
+        matrix index (see :attr:`shape_indexes`), with the electrode
+        identifier as categorical ``shape_id`` column.
+
+        The frame is built on access (i.e., it is not held by the device).
+        '''
+        codes = self.indexed_shapes.index.values
+        df_centers = self.df_shape_centers.reindex(self.indexed_shapes.values)
+        return pd.DataFrame({'shape_id': self.decode_electrodes(codes),
+                             'x_center': df_centers['x_center'].values,
+                             'y_center': df_centers['y_center'].values},
+                            columns=['shape_id', 'x_center', 'y_center'])
+
+    @property
+    def df_shape_connections_indexed(self):
+        '''
+        View of :attr:`df_shape_connections`, where the ``source`` and
+        ``target`` columns hold electrode codes (see :attr:`shape_indexes`).
+
+        The frame is built on access (i.e., it is not held by the device),
+        and shares all other columns with :attr:`df_shape_connections`.
+        '''
+        df_shape_connections = self.df_shape_connections
+        df_indexed = df_shape_connections.copy(deep=False)
+        for column in ('source', 'target'):
+            df_indexed[column] = self._encode(df_shape_connections[column])
+        return df_indexed
+
+    @property
+    def df_shapes_indexed(self):
+        '''
+        View of :attr:`df_shapes`, where the ``id`` column holds the
+        electrode code of each vertex (see :attr:`indexed_electrodes`; codes
+        of connected electrodes match :attr:`shape_indexes`).
+
+        The frame is built on access (i.e., it is not held by the device),
+        and shares the coordinate and attribute columns with
+        :attr:`df_shapes`.
+        '''
+        df_shapes = self.df_shapes
+        df_indexed = df_shapes.copy(deep=False)
+        df_indexed['id'] = self._encode(df_shapes['id'])
+        return df_indexed
+
+    @lazy_property
+    def electrode_areas(self):
+        '''
+        Area of each electrode in square millimeters, indexed by electrode
+        identifier.
+        '''
+        return self.get_electrode_areas()
 
     @property
     def df_electrode_channels(self):
+        '''
+        Frame with the columns ``electrode_id`` and ``channel``, one row per
+        channel connected to an electrode.
+
+        The frame is a view of the channel mapping index (see
+        :class:`dmf_device.channels.ChannelMap`), built on first access after
+        the channel mappings change.
+        '''
         return self._df_electrode_channels
 
     @df_electrode_channels.setter
     def df_electrode_channels(self, value):
+        self._channel_map = ChannelMap.from_frame(value)
+        # Ordered set (`OrderedDict` with `None` values) of identifiers of
+        # electrodes with channels different from the SVG source.
+        self._modified_electrodes = OrderedDict()
+        for electrode_id in itertools.chain(self._channel_map
+                                            .channels_by_electrode,
+                                            self._original_channels):
+            self._track_channels(electrode_id)
+        invalidate(self, self.CHANNEL_ATTRIBUTES)
         self._df_electrode_channels = value
-        self.electrodes_by_channel = (self.df_electrode_channels
-                                      .set_index('channel')['electrode_id'])
-        self.channels_by_electrode = (self.df_electrode_channels
-                                      .set_index('electrode_id')['channel'])
-        self.electrode_areas = self.get_electrode_areas()
-        self.channel_areas = pd.Series([self.electrode_areas
-                                        [self.electrodes_by_channel.ix[c]]
-                                        .sum() for c in
-                                        self.electrodes_by_channel.index],
-                                       index=self.electrodes_by_channel.index)
+
+    @lazy_property
+    def _df_electrode_channels(self):
+        return self._channel_map.to_frame()
+
+    @lazy_property
+    def electrodes_by_channel(self):
+        '''
+        Electrode identifiers, indexed by channel.
+        '''
+        return self.df_electrode_channels.set_index('channel')['electrode_id']
+
+    @lazy_property
+    def channels_by_electrode(self):
+        '''
+        Channels, indexed by electrode identifier.
+        '''
+        return self.df_electrode_channels.set_index('electrode_id')['channel']
+
+    @lazy_property
+    def channel_areas(self):
+        '''
+        Total area of electrodes connected to each channel, indexed by
+        channel.
+        '''
+        # Total area of electrodes connected to each channel.
+        channel_totals = (pd.Series(self.electrode_areas
+                                    .reindex(self.electrodes_by_channel.values)
+                                    .values,
+                                    index=self.electrodes_by_channel.index)
+                          .groupby(level=0).sum())
+        return pd.Series(channel_totals
+                         .reindex(self.electrodes_by_channel.index).values,
+                         index=self.electrodes_by_channel.index)
 
     @property
     def dirty(self):
@@ -149,6 +802,10 @@ class DmfDevice(object):
 
         .. note:: Existing channels assigned to electrode are overwritten.
 
+        .. note:: Within a :meth:`channel_edits` block, derived state
+            (including the returned modified state) is only updated when the
+            block exits.
+
         Parameters
         ----------
         electrode_id : str
@@ -161,30 +818,109 @@ class DmfDevice(object):
         bool
             ``True`` if channel mappings have changed.
         '''
-        # Get electrode channels frame for all electrodes except
-        # `electrode_id`.
-        df_electrode_channels = (self.df_electrode_channels
-                                 .loc[self.df_electrode_channels.electrode_id
-                                      != electrode_id])
-        if len(channels) > 0:
-            # Add new list of channels for electrode.
-            df_electrode_channels_i = pd.DataFrame([[electrode_id, channel]
-                                                    for channel in
-                                                    channels],
-                                                   columns=['electrode_id',
-                                                            'channel'])
-            self.df_electrode_channels = (pd.concat([df_electrode_channels,
-                                                     df_electrode_channels_i])
-                                          .reset_index(drop=True))
-        else:
-            # No channels assigned to electrode.
-            self.df_electrode_channels = df_electrode_channels
+        # Update index entries of electrode and its (old and new) channels.
+        self._channel_map.set(electrode_id, channels)
+        self._track_channels(electrode_id)
+        if self._channel_edits_depth == 0:
+            self._update_channels_state()
+        return self.dirty
+
+    def set_electrodes_channels(self, electrode_channels):
+        '''
+        Set channels for multiple electrodes.
+
+        Derived channel mapping state is updated once, after all electrodes
+        have been assigned (see :meth:`channel_edits`).
+
+        .. note:: Existing channels assigned to each electrode in
+            :data:`electrode_channels` are overwritten.  Channels of other
+            electrodes are not modified.
+
+        Parameters
+        ----------
+        electrode_channels : dict, pandas.DataFrame or iterable
+            One of:
+
+             - :class:`dict` mapping each electrode identifier to a list of
+               channels;
+             - :class:`pandas.DataFrame` with the columns ``electrode_id`` and
+               ``channel``, one row per channel connected to an electrode
+               (e.g., :attr:`df_electrode_channels` of another device);
+             - iterable of ``(electrode_id, channels)`` pairs.
+
+        Returns
+        -------
+        bool
+            ``True`` if channel mappings have changed.
+        '''
+        if isinstance(electrode_channels, pd.DataFrame):
+            # Group channel rows by electrode (in order of first appearance).
+            grouped = OrderedDict()
+            for electrode_id, channel in zip(electrode_channels
+                                             ['electrode_id'].tolist(),
+                                             electrode_channels['channel']
+                                             .tolist()):
+                grouped.setdefault(electrode_id, []).append(channel)
+            electrode_channels = grouped.items()
+        elif isinstance(electrode_channels, dict):
+            electrode_channels = electrode_channels.items()
+
+        with self.channel_edits():
+            for electrode_id, channels in electrode_channels:
+                self._channel_map.set(electrode_id, channels)
+                self._track_channels(electrode_id)
+        return self.dirty
+
+    @contextlib.contextmanager
+    def channel_edits(self):
+        '''
+        Context manager to defer updates of derived channel mapping state.
+
+        Within the block, :meth:`set_electrode_channels` only updates the
+        channel mapping index; views of the channel mappings (e.g.,
+        :attr:`df_electrode_channels`, :attr:`channel_areas`) and the
+        modified state (:attr:`dirty`) are updated once, when the outermost
+        block exits.
+
+        Example
+        -------
+
+        >>> with device.channel_edits():
+        ...     for electrode_id, channels in board_layout:
+        ...         device.set_electrode_channels(electrode_id, channels)
+        >>> device.dirty
+        True
+        '''
+        self._channel_edits_depth += 1
+        try:
+            yield self
+        finally:
+            self._channel_edits_depth -= 1
+            if self._channel_edits_depth == 0:
+                self._update_channels_state()
+
+    def _update_channels_state(self):
+        '''
+        Update derived state after channel mappings have changed.
+        '''
+        # Discard views of channel mappings.
+        invalidate(self, self.CHANNEL_ATTRIBUTES)
 
         # If the channels mappings have changed, update modified state.
-        df_diff_channels = self.diff_electrode_channels()
-        if df_diff_channels.shape[0] > 0:
+        if self._modified_electrodes:
             self._dirty = True
-        return self.dirty
+
+    def _track_channels(self, electrode_id):
+        '''
+        Update modified state of electrode after its channels were assigned,
+        by comparing *only* the channels of the electrode against its
+        channels in the SVG source.
+        '''
+        # Move electrode to end, in assignment order (see `ChannelMap.set`).
+        self._modified_electrodes.pop(electrode_id, None)
+        if (self._channel_map.get_channels(electrode_id) !=
+                self._original_channels.get(electrode_id, ())):
+            self._modified_electrodes[electrode_id] = None
 
     @property
     def electrodes(self):
@@ -198,9 +934,7 @@ class DmfDevice(object):
             Area of each electrode in square millimeters, indexed by electrode
             identifier.
         '''
-        from svg_model.data_frame import get_shape_areas
-
-        return get_shape_areas(self.df_shapes, self.shape_i_columns)
+        return self.df_electrode_geometry['area'].copy()
 
     def get_svg_frame(self):
         '''
@@ -211,6 +945,9 @@ class DmfDevice(object):
         :meth:`groupby` method may be used, for example, to apply operations to
         vertices on a per-path basis, such as calculating the bounding box.
         '''
+        if self._compact_shapes is not None:
+            # Frame is built on access, so no copy is needed.
+            return self._compact_shapes.to_frame()
         return self.df_shapes.copy()
 
     def get_electrode_channels(self):
@@ -245,8 +982,9 @@ class DmfDevice(object):
             Tuple containing origin-`x`, origin-`y`, width and height,
             respectively.
         '''
-        xmin, ymin = self.df_shapes[['x', 'y']].min().values
-        xmax, ymax = self.df_shapes[['x', 'y']].max().values
+        df_geometry = self.df_electrode_geometry
+        xmin, ymin = df_geometry[['x_min', 'y_min']].min().values
+        xmax, ymax = df_geometry[['x_max', 'y_max']].max().values
         return xmin, ymin, (xmax - xmin), (ymax - ymin)
 
     def max_channel(self):
@@ -257,7 +995,7 @@ class DmfDevice(object):
         '''
         return self.df_electrode_channels.channel.max()
 
-    def get_actuated_electrodes_area(self, electrode_states):
+    def get_actuated_electrodes_area(self, electrode_states, codes=False):
         '''
         Compute area of actuated electrodes.
 
@@ -266,11 +1004,19 @@ class DmfDevice(object):
             electrode_states (pandas.Series) : Electrode states, indexed by
                 electrode identifier.  Any state greater than zero is
                 considered actuated.
+            codes (bool) : If True, `electrode_states` is an array-like
+                containing the state of each electrode code (see
+                `indexed_electrodes`).
 
         Returns:
 
             float : Area of actuated electrodes in square millimeters.
         '''
+        if codes:
+            actuated = np.asarray(electrode_states).ravel() > 0
+            return float(self.electrode_code_areas[:actuated.shape[0]]
+                         [actuated[:self.electrode_code_areas.shape[0]]]
+                         .sum())
         actuated_electrodes = electrode_states[electrode_states > 0]
         # Look up the area of each actuated electrode.
         actuated_electrode_areas = (self.electrode_areas
@@ -289,64 +1035,513 @@ class DmfDevice(object):
 
         Returns:
 
-            float : Area of actuated electrodes in square millimeters.
+            float : Area of actuated electrodes in square millimeters.  Each
+                actuated electrode is counted once, even if it is connected
+                to multiple actuated channels.
         '''
-        if state_of_all_channels.max() == 0:
-            # No channels are actuated.
-            return 0
+        return self._actuation_areas.actuated_area(state_of_all_channels)
 
-        # Get the index of all actuated channels.
-        actuated_channels_index = np.where(state_of_all_channels > 0)[0]
-        # Based on the actuated channels, look up the electrodes that are
-        # actuated.
-        actuated_electrodes = self.actuated_electrodes(actuated_channels_index)
-        # Look up the area of each actuated electrode.
-        actuated_electrode_areas = (self.electrode_areas
-                                    .ix[actuated_electrodes.values])
-        # Compute the total actuated electrode area and scale by device scale.
-        return actuated_electrode_areas.sum()
+    def actuated_areas(self, states, chunk_size=None):
+        '''
+        Compute area of all actuated electrodes for multiple sets of channel
+        states (e.g., for each step of a protocol).
+
+        Equivalent to calling :meth:`actuated_area` for each row of
+        :data:`states`, but computed in one vectorized pass (per chunk).
+
+        Parameters
+        ----------
+        states : array-like, scipy.sparse matrix or iterable
+            Actuation level of each channel (columns) for each set of states
+            (rows), either boolean or analog.  May be a dense array (including
+            :class:`numpy.memmap`), a :mod:`scipy.sparse` matrix, or an
+            iterator of such 2-D chunks (e.g., for logs that do not fit in
+            memory).
+        chunk_size : int, optional
+            Number of rows to process at a time (default: all rows).
+
+        Returns
+        -------
+        numpy.ndarray
+            Area of actuated electrodes in square millimeters, one entry per
+            row of states.
+        '''
+        return self._actuation_areas.actuated_areas(states,
+                                                    chunk_size=chunk_size)
+
+    @lazy_property
+    def _actuation_areas(self):
+        return ActuationAreas(self.df_electrode_channels,
+                              self.electrode_areas)
 
-    def actuated_electrodes(self, actuated_channels_index):
+    def actuated_electrodes(self, actuated_channels_index, codes=False):
         '''
         Parameters
         ----------
         actuated_channels_index : list or array-like
             Actuated channel indexes.
+        codes : bool, optional
+            If ``True``, return electrode codes (see
+            :attr:`indexed_electrodes`) instead of identifiers.  Channels
+            without electrodes are omitted.
 
         Returns
         -------
         pandas.Series
-            Actuated electrode identifiers, indexed by channel index.
+            Actuated electrode identifiers (or codes), indexed by channel
+            index.
         '''
+        if codes:
+            channels, electrode_codes = \
+                self.channel_index.electrodes(actuated_channels_index)
+            return pd.Series(electrode_codes,
+                             index=pd.Index(channels, name='channel'))
         return self.electrodes_by_channel.ix[actuated_channels_index]
 
-    def actuated_channels(self, actuated_electrodes_index):
+    def actuated_channels(self, actuated_electrodes_index, codes=False):
         '''
         Parameters
         ----------
         actuated_electrodes_index : list or array-like
-            Actuated electrode identifiers.
+            Actuated electrode identifiers (or codes, if :data:`codes` is
+            ``True``).
+        codes : bool, optional
+            If ``True``, electrodes are specified and returned as electrode
+            codes (see :attr:`indexed_electrodes`) instead of identifiers.
+            Electrodes without channels are omitted.
 
         Returns
         -------
         pandas.Series
-            Actuated channel index values, indexed by electrode identifier.
+            Actuated channel index values, indexed by electrode identifier
+            (or code).
         '''
+        if codes:
+            electrode_codes, channels = \
+                self.channel_index.channels(actuated_electrodes_index)
+            return pd.Series(channels, index=electrode_codes)
         # Get `pd.Series` of channels corresponding to electrodes.
         return self.channels_by_electrode.ix[actuated_electrodes_index]
 
-    def find_path(self, source_id, target_id):
+    def find_path(self, source_id, target_id, codes=False):
         '''
+        Find shortest path between electrodes, where the length of a path is
+        the total distance between the centers of consecutive electrodes.
+
+        Paths are found using A* search, with the straight-line distance to the
+        target electrode as heuristic.  Recently found paths are cached (see
+        :attr:`_path_cache`), assuming the connections between electrodes do
+        not change in place.
+
+        If :attr:`routing_table` is built (see :meth:`build_routing_table`),
+        the path with the fewest hops is looked up in the table instead.
+
+        Parameters
+        ----------
+        source_id, target_id : str or int
+            Source and target electrode identifiers (or codes, if
+            :data:`codes` is ``True``).
+        codes : bool, optional
+            If ``True``, electrodes are specified and returned as electrode
+            codes (see :attr:`indexed_electrodes`), and paths are searched on
+            :attr:`router` (regardless of :attr:`graph_backend`).
+
         Returns
         -------
-        list
-            A list of nodes on the shortest path from source to target.
+        list or numpy.ndarray
+            A list of nodes on the shortest path from source to target (or an
+            array of electrode codes, if :data:`codes` is ``True``).
+
+        Raises
+        ------
+        networkx.NetworkXNoPath
+            If target is not reachable from source.
         '''
+        if codes:
+            source, target = int(source_id), int(target_id)
+            if self.routing_table is None:
+                shortest_path = self._cached_path(source, target,
+                                                  self._find_code_path)
+            else:
+                shortest_path = self._find_code_path(source, target)
+            return np.array(shortest_path, dtype=np.int64)
         if source_id == target_id:
-            shortest_path = [source_id]
+            return [source_id]
+        if self.routing_table is not None:
+            shortest_path = self.routing_table.shortest_path(
+                self.shape_indexes[source_id], self.shape_indexes[target_id])
+            if shortest_path is None:
+                raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                        (source_id, target_id))
+            return self.indexed_shapes.values[shortest_path].tolist()
+        return self._cached_path(source_id, target_id, self._find_path)
+
+    def _cached_path(self, source, target, find_path):
+        '''
+        Look up path in :attr:`_path_cache`, or find path using
+        :data:`find_path` and add it to the cache.
+        '''
+        shortest_path = self._path_cache.get((source, target))
+        if shortest_path is None:
+            # Connections are undirected, so a cached path in the reverse
+            # direction is also a shortest path.
+            shortest_path = self._path_cache.get((target, source))
+            if shortest_path is not None:
+                shortest_path = shortest_path[::-1]
+        if shortest_path is None:
+            shortest_path = find_path(source, target)
+            self._path_cache.set((source, target), shortest_path)
+        return list(shortest_path)
+
+    def find_electrodes(self, points):
+        '''
+        Find electrode at each point (e.g., mouse positions or detected
+        droplet centers).
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of each point in millimeters (one row per
+            point).
+
+        Returns
+        -------
+        numpy.ndarray
+            Identifier of electrode containing each point, or ``None`` for
+            points not contained in any electrode.
+        '''
+        codes = self.spatial_index.find(points)
+        electrode_ids = np.append(self.indexed_electrodes.values, None)
+        return electrode_ids[codes]
+
+    def find_electrode(self, x, y):
+        '''
+        Returns
+        -------
+        str or None
+            Identifier of electrode containing point ``(x, y)`` (in
+            millimeters), or ``None`` if no electrode contains point.
+        '''
+        return self.find_electrodes([[x, y]])[0]
+
+    def nearest_electrodes(self, points, k=1, max_distance=None):
+        '''
+        Find electrodes with centers nearest to each point.
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of each point in millimeters (one row per
+            point).
+        k : int, optional
+            Number of electrodes to find for each point.
+        max_distance : float, optional
+            Only find electrodes with centers within this distance (in
+            millimeters) of each point.
+
+        Returns
+        -------
+        (distances, electrode_ids) : (numpy.ndarray, numpy.ndarray)
+            Distance to center and identifier of ``k`` nearest electrodes (one
+            row per point, in order of increasing distance).  Missing
+            electrodes have infinite distance and identifier ``None``.
+        '''
+        if max_distance is None:
+            max_distance = np.inf
+        distances, codes = self.center_index.query(points, k=k,
+                                                   max_distance=max_distance)
+        electrode_ids = np.append(self.indexed_electrodes.values, None)
+        return distances, electrode_ids[codes]
+
+    def electrodes_within(self, points, radius):
+        '''
+        Find electrodes with centers within radius of each point.
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of each point in millimeters (one row per
+            point).
+        radius : float
+            Search radius in millimeters.
+
+        Returns
+        -------
+        list
+            Identifiers of electrodes within radius of each point (in order
+            of increasing distance).
+        '''
+        electrode_ids = self.indexed_electrodes.values
+        return [electrode_ids[codes].tolist()
+                for codes in self.center_index.query_radius(points, radius)]
+
+    def label_image(self, shape=None, transform=None, resolution=1.):
+        '''
+        Image where the value of each pixel is the code of the electrode at
+        the pixel (see :attr:`indexed_electrodes`), or -1 for pixels not
+        covered by an electrode.
+
+        Images are cached per shape and transform, such that per-frame
+        electrode statistics of a video are array operations on the label
+        image, e.g.:
+
+        >>> labels = device.label_image((480, 640), camera_transform)
+        >>> intensity = device.electrode_means(frame, labels)
+
+        Parameters
+        ----------
+        shape : tuple, optional
+            ``(height, width)`` of image in pixels (default: size of device
+            at the specified transform or resolution).
+        transform : array-like, optional
+            Affine transform (``2x3`` or ``3x3`` matrix) from device
+            coordinates (in millimeters) to pixel coordinates, where ``(x,
+            y)`` is the center of the pixel at column ``x`` and row ``y``.
+        resolution : float, optional
+            Pixels per millimeter, if no transform is specified.
+
+        Returns
+        -------
+        numpy.ndarray
+            Read-only image of electrode codes.
+        '''
+        if transform is None:
+            transform = [[resolution, 0, 0], [0, resolution, 0]]
+        transform = affine_matrix(transform)
+        if shape is None:
+            corners = np.array([[x, y, 1] for x in (0, 1) for y in (0, 1)],
+                               dtype=float)
+            # Use electrode bounding boxes, since `df_shapes` may be rebuilt
+            # from compact storage on every access.
+            corners[:, :2] *= (self.df_electrode_geometry[['x_max', 'y_max']]
+                               .max().values)
+            pixel_max = corners.dot(transform.T)[:, :2].max(axis=0)
+            shape = tuple(int(v) + 1 for v in
+                          np.ceil(np.maximum(pixel_max, 0))[::-1])
+        key = (tuple(shape), tuple(transform.ravel().tolist()))
+        labels = self._label_images.get(key)
+        if labels is None:
+            labels = rasterize_labels(self.spatial_index, shape, transform)
+            labels.flags.writeable = False
+            self._label_images.set(key, labels)
+        return labels
+
+    def electrode_means(self, image, labels):
+        '''
+        Parameters
+        ----------
+        image : numpy.ndarray
+            Image (e.g., camera frame), with the same height and width as
+            ``labels``.
+        labels : numpy.ndarray
+            Label image (see :meth:`label_image`).
+
+        Returns
+        -------
+        pandas.DataFrame or pandas.Series
+            Mean pixel value (per colour channel, if any) of each electrode,
+            indexed by electrode identifier.
+        '''
+        means = label_means(labels, image, self.indexed_electrodes.shape[0])
+        index = pd.Index(self.indexed_electrodes.values, name='electrode_id')
+        if means.ndim == 1:
+            return pd.Series(means, index=index)
+        return pd.DataFrame(means.reshape(means.shape[0], -1), index=index)
+
+    def path_planner(self, source_id, target_id):
+        '''
+        Create planner for shortest path between two electrodes that is
+        repaired incrementally as electrodes or connections are blocked,
+        unblocked, or change cost (e.g., to route around dead electrodes or
+        occupied reservoirs).
+
+        Connection costs default to the distance between electrode centers,
+        consistent with :meth:`find_path`.
+
+        Example
+        -------
+
+        >>> planner = device.path_planner('electrode000', 'electrode019')
+        >>> path = planner.find_path()
+        >>> planner.block_electrodes(['electrode008'])
+        >>> path = planner.find_path()  # Only affected region is searched.
+
+        Returns
+        -------
+        dmf_device.dynamic_routing.PathPlanner
+        '''
+        lpa_star = LpaStar(self.csr_graph, self.router.coordinates,
+                           self.shape_indexes[source_id],
+                           self.shape_indexes[target_id])
+        return PathPlanner(lpa_star, self.indexed_shapes.values)
+
+    def find_paths(self, source_ids, target_ids, processes=1):
+        '''
+        Find shortest paths for multiple ``(source, target)`` electrode pairs
+        at once.
+
+        Duplicate pairs are searched once, and all pairs with the same source
+        are answered by a single search on :attr:`router` (regardless of
+        :attr:`graph_backend`).  If :attr:`routing_table` is built, paths are
+        looked up in the table instead.
+
+        Parameters
+        ----------
+        source_ids, target_ids : list
+            Source and target electrode identifier of each pair.
+        processes : int, optional
+            Number of worker processes to search in (default: 1, i.e., search
+            in the current process).  If ``None``, use one process per CPU.
+
+        Returns
+        -------
+        list
+            List of electrode identifiers on shortest path for each pair (in
+            input order), or ``None`` for each pair where target is not
+            reachable from source.
+        '''
+        source_ids = list(source_ids)
+        target_ids = list(target_ids)
+        if len(source_ids) != len(target_ids):
+            raise ValueError('Number of sources and targets differ.')
+        sources = self.shape_indexes[source_ids].values
+        targets = self.shape_indexes[target_ids].values
+        if self.routing_table is not None:
+            paths = [self.routing_table.shortest_path(source, target)
+                     for source, target in zip(sources, targets)]
+        else:
+            paths = batch_shortest_paths(self.router, sources, targets,
+                                         processes=processes)
+        shape_ids = self.indexed_shapes.values
+        return [None if path is None else shape_ids[path].tolist()
+                for path in paths]
+
+    def hop_distance(self, source_id, target_id):
+        '''
+        Returns
+        -------
+        int
+            Number of hops on path with the fewest hops from source to target
+            electrode.
+
+        Raises
+        ------
+        networkx.NetworkXNoPath
+            If target is not reachable from source.
+        '''
+        source = self.shape_indexes[source_id]
+        target = self.shape_indexes[target_id]
+        if self.routing_table is not None:
+            distance = self.routing_table.distance(source, target)
         else:
-            shortest_path = nx.dijkstra_path(self.graph, source_id, target_id,
-                                             'cost')
+            distance = int(self.csr_graph.bfs(source)[0][target])
+        if distance < 0:
+            raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                    (source_id, target_id))
+        return distance
+
+    def route_droplets(self, source_ids, target_ids, order=None,
+                       max_steps=None):
+        '''
+        Plan simultaneous routes of multiple droplets.
+
+        At each step, every droplet either stays on its electrode or moves to
+        a neighbouring electrode, such that no two droplets are ever on the
+        same or adjacent electrodes (see :mod:`dmf_device.droplets`).
+
+        Parameters
+        ----------
+        source_ids, target_ids : list
+            Source and target electrode identifier of each droplet.
+        order : list, optional
+            Order (i.e., priority) in which to plan droplet routes, as droplet
+            indexes.  By default, droplets with the longest distance to travel
+            are planned first.
+        max_steps : int, optional
+            Maximum number of steps of each route.
+
+        Returns
+        -------
+        (df_routes, channel_states) : (pandas.DataFrame, numpy.ndarray)
+            Electrode identifier of each droplet (column) at each step (row),
+            and actuation state of each channel (column) at each step (row),
+            where the channels of the electrodes occupied by droplets are
+            actuated.
+
+        Raises
+        ------
+        dmf_device.droplets.NoRouteError
+            If no route was found for a droplet.
+        '''
+        sources = self.shape_indexes[list(source_ids)].values
+        targets = self.shape_indexes[list(target_ids)].values
+        positions = self.droplet_router.route(sources, targets, order=order,
+                                              max_steps=max_steps)
+        df_routes = pd.DataFrame(self.indexed_shapes.values[positions])
+        df_routes.index.name = 'step'
+        # Codes of connected electrodes match `shape_indexes`.
+        return df_routes, self.electrode_channel_states(positions, codes=True)
+
+    def electrode_channel_states(self, electrode_ids, codes=False):
+        '''
+        Parameters
+        ----------
+        electrode_ids : array-like
+            Two-dimensional array of actuated electrode identifiers (or codes,
+            if :data:`codes` is ``True``), one row per set of channel states.
+        codes : bool, optional
+            If ``True``, electrodes are specified as electrode codes (see
+            :attr:`indexed_electrodes`).
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean actuation state of each channel (column) for each row of
+            electrodes, where channels connected to actuated electrodes are
+            ``True``.
+        '''
+        if not codes:
+            electrode_ids = np.atleast_2d(np.asarray(electrode_ids,
+                                                     dtype=object))
+            electrode_ids = (self._encode(electrode_ids)
+                             .reshape(electrode_ids.shape))
+        return self.channel_index.channel_states(electrode_ids)
+
+    def _find_path(self, source_id, target_id):
+        if self.graph_backend == 'csr':
+            source = self.shape_indexes[source_id]
+            target = self.shape_indexes[target_id]
+            shortest_path = self.router.shortest_path(source, target)
+            if shortest_path is None:
+                raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                        (source_id, target_id))
+            return self.indexed_shapes.values[shortest_path].tolist()
+        else:
+            centers = self._centers_by_id
+
+            def heuristic(node_a, node_b):
+                (x_a, y_a), (x_b, y_b) = centers[node_a], centers[node_b]
+                return math.hypot(x_b - x_a, y_b - y_a)
+
+            return nx.astar_path(self.graph, source_id, target_id,
+                                 heuristic=heuristic, weight='distance')
+
+    def _find_code_path(self, source, target):
+        if source == target:
+            return [source]
+        # Codes of connected electrodes match `shape_indexes`, and electrodes
+        # without connections are not reachable.
+        shortest_path = None
+        connected_count = self.indexed_shapes.shape[0]
+        if 0 <= source < connected_count and 0 <= target < connected_count:
+            if self.routing_table is not None:
+                shortest_path = self.routing_table.shortest_path(source,
+                                                                 target)
+            else:
+                shortest_path = self.router.shortest_path(source, target)
+        if shortest_path is None:
+            raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                    (source, target))
         return shortest_path
 
     def to_svg(self):
@@ -355,19 +1550,58 @@ class DmfDevice(object):
 
             unicode : SVG XML source with up-to-date electrode channel lists.
         '''
-        xml_root = etree.parse(self.svg_filepath)
+        return etree.tounicode(self._update_svg_document())
 
-        # Identify electrodes with modified channel lists.
-        df_diff_channels = self.diff_electrode_channels()
+    def save(self, output):
+        '''
+        Write SVG document with up-to-date electrode channel lists (see
+        :meth:`to_svg`).
+
+        The document is serialized directly to the output, without building
+        the whole document as a string in memory.
+
+        Parameters
+        ----------
+        output : str or file-like
+            Output file path or binary file-like object.  A file path is
+            written to a temporary file first, which then replaces the output
+            file, such that an existing file is never left partially written.
+        '''
+        xml_tree = self._update_svg_document()
 
-        # Update `svg:path` XML elements for electrodes with modified channel
-        # lists.
-        xpath = XPathEvaluator(xml_root, namespaces=INKSCAPE_NSMAP)
-        for electrode_id, (orig_i, new_i) in df_diff_channels.iterrows():
-            elements_i = xpath.evaluate('//svg:path[@id="%s"]' % electrode_id)
-            for element_i in elements_i:
-                element_i.attrib['data-channels'] = ','.join(map(str, new_i))
-        return etree.tounicode(xml_root)
+        def write(output):
+            xml_tree.write(output, encoding='utf-8', xml_declaration=True)
+
+        if hasattr(output, 'write'):
+            write(output)
+        else:
+            cache.atomic_write(output, write)
+
+    def _update_svg_document(self):
+        '''
+        Returns
+        -------
+        lxml.etree._ElementTree
+            Parsed SVG document with up-to-date electrode channel lists.
+
+            If :attr:`retain_svg_tree` is set, the document (and its index of
+            electrode shapes) is reused by subsequent calls, such that only
+            electrodes modified since the previous call are updated.
+        '''
+        document = self._svg_document
+        if document is None:
+            xml_tree = (parse_svg(self.svg_filepath) if self._xml_tree is None
+                        else self._xml_tree)
+            document = ChannelsDocument(xml_tree, xpath=ELECTRODES_XPATH)
+            if self.retain_svg_tree:
+                self._xml_tree = xml_tree
+                self._svg_document = document
+
+        # Update electrode shapes (`svg:path` or `svg:polygon`) with modified
+        # channel lists in one pass.
+        df_diff_channels = self.diff_electrode_channels()
+        return document.update(dict(zip(df_diff_channels.index,
+                                        df_diff_channels['new'])))
 
     def diff_electrode_channels(self):
         '''
@@ -380,23 +1614,10 @@ class DmfDevice(object):
             contain a list for the original and new assigned channels,
             respectively, indexed by ``electrode_id``.
         '''
-        original_channels = extract_channels(self.df_shapes)
-        original_groups = original_channels.groupby('electrode_id').groups
-
-        new_channels = self.df_electrode_channels.copy()
-        new_groups = new_channels.groupby('electrode_id').groups
-
-        rows = []
-
-        for electrode_id, new_channel_indexes in new_groups.iteritems():
-            if electrode_id not in original_groups:
-                orig_i = []
-            else:
-                orig_i = (original_channels.channel
-                        .values[original_groups[electrode_id]].tolist())
-            new_i = new_channels.channel.values[new_channel_indexes].tolist()
-            if not (orig_i == new_i):
-                rows.append((electrode_id, orig_i, new_i))
+        rows = [(electrode_id,
+                 list(self._original_channels.get(electrode_id, ())),
+                 list(self._channel_map.get_channels(electrode_id)))
+                for electrode_id in self._modified_electrodes]
         if not rows:
             rows = None
         return pd.DataFrame(rows, columns=['electrode_id', 'original',
@@ -427,20 +1648,29 @@ def extract_channels(df_shapes):
         ``"electrode_id"`` column corresponds to the ``"id"`` attribute of the
         corresponding SVG polygon.
     '''
-    frames = []
+    df_channels = pd.DataFrame(None, columns=['electrode_id', 'channel'])
 
     if 'data-channels' in df_shapes:
         shape_channel_lists = (df_shapes
                                .drop_duplicates(subset=['id', 'data-channels'])
-                               .set_index('id')['data-channels']
-                               .str.split(',').dropna())
-
-        for shape_i, channels_i in shape_channel_lists.iteritems():
-            frames.extend([[shape_i, int(channel)] for channel in channels_i])
-
-    if frames:
-        df_channels = pd.DataFrame(frames, columns=['electrode_id', 'channel'])
-    else:
-        df_channels = pd.DataFrame(None, columns=['electrode_id', 'channel'])
+                               .set_index('id')['data-channels'].dropna())
+
+        if shape_channel_lists.shape[0] > 0:
+            # Tokenize all channel lists at once by joining them into a
+            # single comma-separated string, and repeat each electrode
+            # identifier once per token in the corresponding list.
+            channel_lists = shape_channel_lists.values.astype(object)
+            list_lengths = np.array([channels_i.count(',')
+                                     for channels_i in channel_lists]) + 1
+            channels = np.array(','.join(channel_lists).split(','))
+            electrode_ids = np.repeat(shape_channel_lists.index.values,
+                                      list_lengths)
+            # Skip empty entries (e.g., `data-channels=""`).
+            non_empty = channels != ''
+            df_channels = pd.DataFrame({'electrode_id':
+                                        electrode_ids[non_empty],
+                                        'channel': channels[non_empty]
+                                        .astype(int)},
+                                       columns=['electrode_id', 'channel'])
     df_channels['channel'] = df_channels['channel'].astype(int)
     return df_channels
@@ -0,0 +1,168 @@
+'''
+Detect connected (i.e., neighbouring) electrodes from electrode geometry.
+
+Two electrodes are considered connected if an edge of one electrode runs
+alongside an edge of the other, i.e., the edges are (nearly) parallel, at
+most a gap tolerance apart, and overlap by more than a minimum length.
+Electrodes that only touch at a corner (e.g., diagonal neighbours in a grid)
+are *not* connected.
+
+Candidate edge pairs are found using a uniform grid over edge bounding boxes,
+rather than comparing all pairs of polygons.
+'''
+import numpy as np
+import pandas as pd
+
+from .geometry import ordered_vertices
+from .graph import concatenated_ranges
+from .spatial import box_cells
+
+
+def polygon_edges(df_shapes, shape_i_column='id'):
+    '''
+    Parameters
+    ----------
+    df_shapes : pandas.DataFrame
+        Frame with one row per polygon vertex, with the columns ``x``, ``y``
+        and :data:`shape_i_column`, ordered by vertex within each polygon.
+    shape_i_column : str, optional
+        Column identifying the polygon of each vertex.
+
+    Returns
+    -------
+    (shape_ids, edge_shapes, edges) : (pandas.Index, numpy.ndarray,
+    numpy.ndarray)
+        Sorted polygon identifiers, polygon code of each edge, and
+        ``(x1, y1, x2, y2)`` of each (non-degenerate) edge.
+    '''
+    shape_ids, codes, x, y, _, _, next_vertex = \
+        ordered_vertices(df_shapes, shape_i_column)
+    edges = np.column_stack([x, y, x[next_vertex], y[next_vertex]])
+    nondegenerate = ((edges[:, 0] != edges[:, 2]) |
+                     (edges[:, 1] != edges[:, 3]))
+    return (pd.Index(shape_ids), codes[nondegenerate],
+            edges[nondegenerate])
+
+
+def candidate_edge_pairs(edges, margin, cell_size=None):
+    '''
+    Find pairs of edges with overlapping bounding boxes (expanded by margin)
+    using a uniform grid.
+
+    Parameters
+    ----------
+    edges : numpy.ndarray
+        ``(x1, y1, x2, y2)`` of each edge.
+    margin : float
+        Distance to expand each edge bounding box by.
+    cell_size : float, optional
+        Grid cell size (default: median edge length, at least twice the
+        margin).
+
+    Returns
+    -------
+    (first, second) : (numpy.ndarray, numpy.ndarray)
+        Indexes of edges of each candidate pair, where ``first < second``.
+        Pairs may be repeated.
+    '''
+    if edges.shape[0] < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lower = np.minimum(edges[:, :2], edges[:, 2:]) - margin
+    upper = np.maximum(edges[:, :2], edges[:, 2:]) + margin
+    if cell_size is None:
+        lengths = np.hypot(*(edges[:, 2:] - edges[:, :2]).T)
+        cell_size = max(np.median(lengths), 2 * margin, 1e-9)
+    origin = lower.min(axis=0)
+    cell_min = np.floor((lower - origin) / cell_size).astype(np.int64)
+    cell_max = np.floor((upper - origin) / cell_size).astype(np.int64)
+    grid_width = cell_max[:, 0].max() + 1
+
+    # One entry per (edge, grid cell overlapped by edge).
+    entry_edges, cells = box_cells(cell_min, cell_max, grid_width)
+    order = np.lexsort((entry_edges, cells))
+    cells, entry_edges = cells[order], entry_edges[order]
+
+    # Pair each entry with every following entry in the same grid cell.
+    cell_starts = np.concatenate([[0], np.nonzero(np.diff(cells))[0] + 1])
+    cell_counts = np.diff(np.append(cell_starts, cells.shape[0]))
+    positions = np.arange(cells.shape[0])
+    group_ends = np.repeat(cell_starts + cell_counts, cell_counts)
+    pair_counts = group_ends - positions - 1
+    first = np.repeat(positions, pair_counts)
+    second = concatenated_ranges(positions + 1, pair_counts)
+    return entry_edges[first], entry_edges[second]
+
+
+def geometric_connections(df_shapes, tolerance=1., min_overlap=None,
+                          max_angle=10., shape_i_column='id'):
+    '''
+    Detect connected electrodes from electrode polygons.
+
+    Parameters
+    ----------
+    df_shapes : pandas.DataFrame
+        Frame with one row per polygon vertex, with the columns ``x``, ``y``
+        and :data:`shape_i_column`, ordered by vertex within each polygon.
+    tolerance : float, optional
+        Maximum gap between edges of connected electrodes (in units of
+        ``x``/``y``, e.g., millimeters).
+    min_overlap : float, optional
+        Minimum length along which edges of connected electrodes must run
+        alongside each other (default: ``tolerance``).
+    max_angle : float, optional
+        Maximum angle (in degrees) between edges of connected electrodes.
+    shape_i_column : str, optional
+        Column identifying the polygon of each vertex.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Each row corresponds to connection between two electrodes, denoted
+        ``source`` and ``target`` (where ``source < target``).
+    '''
+    if min_overlap is None:
+        min_overlap = tolerance
+    shape_ids, edge_shapes, edges = polygon_edges(df_shapes, shape_i_column)
+    first, second = candidate_edge_pairs(edges, .5 * tolerance)
+    different = edge_shapes[first] != edge_shapes[second]
+    first, second = first[different], second[different]
+
+    a_start, a_end = edges[first, :2], edges[first, 2:]
+    b_start, b_end = edges[second, :2], edges[second, 2:]
+    a_length = np.hypot(*(a_end - a_start).T)
+    direction = (a_end - a_start) / a_length[:, None]
+    b_direction = b_end - b_start
+    b_direction /= np.hypot(*b_direction.T)[:, None]
+
+    def cross(u, v):
+        return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+    # Edges must be (nearly) parallel.
+    parallel = np.abs(cross(direction, b_direction)) <= \
+        np.sin(np.radians(max_angle))
+    # Position of end points of second edge relative to first edge: along
+    # first edge, and perpendicular distance from line of first edge.
+    along = np.column_stack([((b_start - a_start) * direction).sum(axis=1),
+                             ((b_end - a_start) * direction).sum(axis=1)])
+    across = np.column_stack([cross(direction, b_start - a_start),
+                              cross(direction, b_end - a_start)])
+    # Clip second edge to extent of first edge, and measure gap at clipped
+    # end points.
+    low = np.maximum(along.min(axis=1), 0)
+    high = np.minimum(along.max(axis=1), a_length)
+    overlap = high - low
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (across[:, 1] - across[:, 0]) / (along[:, 1] - along[:, 0])
+    slope[~np.isfinite(slope)] = 0
+    gap = np.maximum(np.abs(across[:, 0] + slope * (low - along[:, 0])),
+                     np.abs(across[:, 0] + slope * (high - along[:, 0])))
+    connected = parallel & (overlap > min_overlap) & (gap <= tolerance)
+
+    sources = edge_shapes[first[connected]]
+    targets = edge_shapes[second[connected]]
+    sources, targets = (np.minimum(sources, targets),
+                        np.maximum(sources, targets))
+    keys = np.unique(sources * len(shape_ids) + targets)
+    return pd.DataFrame({'source': shape_ids.values[keys // len(shape_ids)],
+                         'target': shape_ids.values[keys % len(shape_ids)]},
+                        columns=['source', 'target'])
@@ -0,0 +1,257 @@
+'''
+On-disk cache of compiled :class:`dmf_device.DmfDevice` state.
+
+Loading a device from an SVG drawing involves parsing the drawing, detecting
+connections between electrodes and computing several derived frames.  The
+functions in this module persist the fully derived state of a device to a
+binary (pickle) file so that subsequent loads of the *same* drawing can skip
+all of these steps.
+
+Each cache entry is stored in a file named after the absolute path of the
+source drawing.  The entry starts with a key computed from the *contents* of
+the drawing, the version of this library, the cache format and any loading
+options.  If the key of an existing entry does not match the key of the
+drawing being loaded, the entry is considered stale and is replaced.
+'''
+import hashlib
+import logging
+import os
+import tempfile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .routing import RoutingTable
+
+
+logger = logging.getLogger(__name__)
+
+#: Version of the layout of cached device state.  Must be incremented whenever
+#: the set (or type) of attributes stored by :meth:`DmfDevice.__getstate__`
+#: changes.
+CACHE_FORMAT = 21
+
+
+def get_version():
+    '''
+    Returns
+    -------
+    str
+        Version of the installed ``dmf-device`` distribution (or
+        ``"0+unknown"`` if the distribution is not installed).
+    '''
+    try:
+        import pkg_resources
+
+        return pkg_resources.get_distribution('dmf-device').version
+    except Exception:
+        return '0+unknown'
+
+
+def device_cache_key(svg_filepath, **kwargs):
+    '''
+    Compute cache key for device loaded from SVG file.
+
+    Parameters
+    ----------
+    svg_filepath : str
+        Path to SVG device drawing.
+    **kwargs
+        Device loading options that affect derived state.
+
+    Returns
+    -------
+    str
+        Hex digest of SVG file contents, library version, cache format and
+        loading options.
+    '''
+    digest = hashlib.sha1()
+    with open(svg_filepath, 'rb') as input_:
+        for chunk in iter(lambda: input_.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(('%s|%s|%r' % (get_version(), CACHE_FORMAT,
+                                 sorted(kwargs.items()))).encode('utf8'))
+    return digest.hexdigest()
+
+
+def cache_filepath(cache_dir, svg_filepath):
+    '''
+    Returns
+    -------
+    str
+        Path of cache entry for SVG file within cache directory.
+    '''
+    svg_filepath = os.path.abspath(svg_filepath)
+    path_hash = hashlib.sha1(svg_filepath.encode('utf8')).hexdigest()
+    namebase = os.path.splitext(os.path.basename(svg_filepath))[0]
+    return os.path.join(cache_dir, '%s-%s.pickle' % (namebase, path_hash))
+
+
+def load_state(cache_dir, svg_filepath, key):
+    '''
+    Load cached device state.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory.
+    svg_filepath : str
+        Path to SVG device drawing.
+    key : str
+        Cache key (see :func:`device_cache_key`).
+
+    Returns
+    -------
+    dict or None
+        Cached device state, or ``None`` if no valid entry exists.
+    '''
+    filepath = cache_filepath(cache_dir, svg_filepath)
+    if not os.path.isfile(filepath):
+        return None
+    try:
+        with open(filepath, 'rb') as input_:
+            # Key is stored first so stale entries are detected without
+            # reading the (potentially large) state.
+            if pickle.load(input_) != key:
+                logger.debug('Stale device cache entry: `%s`', filepath)
+                return None
+            return pickle.load(input_)
+    except Exception:
+        logger.warning('Error reading device cache entry: `%s`', filepath,
+                       exc_info=True)
+        return None
+
+
+def save_state(cache_dir, svg_filepath, key, state):
+    '''
+    Save device state to cache, replacing any existing entry.
+
+    The entry is written to a temporary file first and then renamed (see
+    :func:`atomic_write`).
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory (created if it does not exist).
+    svg_filepath : str
+        Path to SVG device drawing.
+    key : str
+        Cache key (see :func:`device_cache_key`).
+    state : dict
+        Device state (see :meth:`DmfDevice.__getstate__`).
+    '''
+    def write(output):
+        pickle.dump(key, output, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(state, output, pickle.HIGHEST_PROTOCOL)
+
+    atomic_write(cache_filepath(cache_dir, svg_filepath), write)
+
+
+def routing_table_filepath(cache_dir, svg_filepath):
+    '''
+    Returns
+    -------
+    str
+        Path of routing table cache entry for SVG file within cache
+        directory.
+    '''
+    return os.path.splitext(cache_filepath(cache_dir, svg_filepath))[0] + \
+        '-routing.npz'
+
+
+def load_routing_table(cache_dir, svg_filepath, key):
+    '''
+    Load cached routing table.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory.
+    svg_filepath : str
+        Path to SVG device drawing.
+    key : str
+        Cache key (see :func:`device_cache_key`).
+
+    Returns
+    -------
+    dmf_device.routing.RoutingTable or None
+        Cached routing table, or ``None`` if no valid entry exists.
+    '''
+    filepath = routing_table_filepath(cache_dir, svg_filepath)
+    if not os.path.isfile(filepath):
+        return None
+    try:
+        with open(filepath, 'rb') as input_:
+            if pickle.load(input_) != key:
+                logger.debug('Stale routing table cache entry: `%s`',
+                             filepath)
+                return None
+            return RoutingTable.load(input_)
+    except Exception:
+        logger.warning('Error reading routing table cache entry: `%s`',
+                       filepath, exc_info=True)
+        return None
+
+
+def save_routing_table(cache_dir, svg_filepath, key, routing_table):
+    '''
+    Save routing table to cache, replacing any existing entry.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Cache directory (created if it does not exist).
+    svg_filepath : str
+        Path to SVG device drawing.
+    key : str
+        Cache key (see :func:`device_cache_key`).
+    routing_table : dmf_device.routing.RoutingTable
+        Routing table.
+    '''
+    def write(output):
+        pickle.dump(key, output, pickle.HIGHEST_PROTOCOL)
+        routing_table.save(output)
+
+    atomic_write(routing_table_filepath(cache_dir, svg_filepath), write)
+
+
+def atomic_write(filepath, write):
+    '''
+    Write to a temporary file first and then rename it to the output file
+    path, to avoid leaving a partially written file behind (e.g., if multiple
+    processes load the same device concurrently, or if writing is
+    interrupted).
+
+    Parameters
+    ----------
+    filepath : str
+        Output file path (parent directory is created if it does not exist).
+    write : function
+        Function to write contents to an open (binary) file object.
+    '''
+    output_dir = os.path.dirname(os.path.abspath(filepath))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    fd, temp_filepath = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            write(output)
+        # Temporary files are only accessible by the owner, so apply the mode
+        # of the file being replaced (or the default mode for new files).
+        if os.path.exists(filepath):
+            mode = os.stat(filepath).st_mode & 0o777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temp_filepath, mode)
+        if os.name == 'nt' and os.path.exists(filepath):
+            # `os.rename` does not replace existing files on Windows.
+            os.remove(filepath)
+        os.rename(temp_filepath, filepath)
+    except Exception:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise
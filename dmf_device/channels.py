@@ -0,0 +1,433 @@
+'''
+Incrementally updated mapping between electrodes and channels.
+'''
+from collections import OrderedDict
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from .graph import csr_positions
+
+
+class ChannelMap(object):
+    '''
+    Mapping between electrodes and the channels assigned to them, indexed in
+    both directions.
+
+    Assigning the channels of a single electrode only updates the index
+    entries of that electrode and of the affected channels, i.e., it costs
+    $O(k)$ for $k$ old and new channels (rather than $O(N)$ for $N$
+    electrodes).
+
+    Attributes
+    ----------
+    channels_by_electrode : collections.OrderedDict
+        Tuple of channels, keyed by electrode identifier.  Electrodes are kept
+        in assignment order (most recently assigned electrode last).
+    electrodes_by_channel : dict
+        Ordered set (:class:`collections.OrderedDict` with ``None`` values) of
+        electrode identifiers, keyed by channel.
+    '''
+    def __init__(self, pairs=None):
+        '''
+        Parameters
+        ----------
+        pairs : iterable, optional
+            ``(electrode_id, channel)`` pairs.
+        '''
+        self.channels_by_electrode = OrderedDict()
+        self.electrodes_by_channel = {}
+        if pairs is not None:
+            for electrode_id, channels in itertools.groupby(pairs,
+                                                            lambda x: x[0]):
+                channels = [channel for electrode_id_i, channel in channels]
+                self.set(electrode_id,
+                         self.channels_by_electrode.get(electrode_id, ()) +
+                         tuple(channels), reorder=False)
+
+    @classmethod
+    def from_frame(cls, df_electrode_channels):
+        '''
+        Parameters
+        ----------
+        df_electrode_channels : pandas.DataFrame
+            Frame with the columns ``electrode_id`` and ``channel``, one row
+            per channel connected to an electrode.
+
+        Returns
+        -------
+        ChannelMap
+        '''
+        return cls(zip(df_electrode_channels['electrode_id'].tolist(),
+                       df_electrode_channels['channel'].tolist()))
+
+    def __len__(self):
+        return len(self.channels_by_electrode)
+
+    def get_channels(self, electrode_id):
+        '''
+        Returns
+        -------
+        tuple
+            Channels assigned to electrode (empty if none).
+        '''
+        return self.channels_by_electrode.get(electrode_id, ())
+
+    def get_electrodes(self, channel):
+        '''
+        Returns
+        -------
+        list
+            Identifiers of electrodes connected to channel (empty if none).
+        '''
+        return list(self.electrodes_by_channel.get(channel, ()))
+
+    def set(self, electrode_id, channels, reorder=True):
+        '''
+        Set channels assigned to electrode, replacing existing channels.
+
+        Parameters
+        ----------
+        electrode_id : str
+            Electrode identifier.
+        channels : list
+            Channels assigned to the electrode.
+        reorder : bool, optional
+            If ``True`` (default), move electrode to the end of
+            :attr:`channels_by_electrode`, i.e., consistent with removing
+            the rows of the electrode from a channels frame and appending new
+            rows.
+
+        Returns
+        -------
+        tuple
+            Channels previously assigned to electrode.
+        '''
+        channels = tuple(channels)
+        if reorder:
+            previous = self.channels_by_electrode.pop(electrode_id, ())
+        else:
+            previous = self.channels_by_electrode.get(electrode_id, ())
+
+        for channel in set(previous):
+            electrodes = self.electrodes_by_channel[channel]
+            electrodes.pop(electrode_id, None)
+            if not electrodes:
+                del self.electrodes_by_channel[channel]
+
+        if channels:
+            self.channels_by_electrode[electrode_id] = channels
+            for channel in channels:
+                (self.electrodes_by_channel.setdefault(channel, OrderedDict())
+                 [electrode_id]) = None
+        else:
+            self.channels_by_electrode.pop(electrode_id, None)
+        return previous
+
+    def to_frame(self):
+        '''
+        Returns
+        -------
+        pandas.DataFrame
+            Frame with the columns ``electrode_id`` and ``channel``, one row
+            per channel connected to an electrode.
+        '''
+        electrode_ids = list(self.channels_by_electrode.keys())
+        channel_lists = list(self.channels_by_electrode.values())
+        channels = np.fromiter(itertools.chain.from_iterable(channel_lists),
+                               dtype=int)
+        lengths = [len(channels_i) for channels_i in channel_lists]
+        electrode_ids = np.repeat(np.array(electrode_ids, dtype=object),
+                                  lengths)
+        return pd.DataFrame({'electrode_id': electrode_ids,
+                             'channel': channels},
+                            columns=['electrode_id', 'channel'])
+
+
+class ChannelIndex(object):
+    '''
+    Mapping between electrode *codes* and channels, as compressed sparse row
+    (CSR) arrays in both directions, for vectorized lookups without any
+    hashing of electrode identifiers.
+
+    Attributes
+    ----------
+    electrode_indptr : numpy.ndarray
+        Channels of electrode code ``i`` are
+        ``electrode_channels[electrode_indptr[i]:electrode_indptr[i + 1]]``.
+    electrode_channels : numpy.ndarray
+        Channels of each electrode, concatenated in electrode code order.
+    channel_indptr : numpy.ndarray
+        Electrode codes connected to channel ``j`` are
+        ``channel_electrodes[channel_indptr[j]:channel_indptr[j + 1]]``.
+    channel_electrodes : numpy.ndarray
+        Electrode codes of each channel, concatenated in channel order.
+    '''
+    def __init__(self, electrode_codes, channels, electrode_count):
+        '''
+        Parameters
+        ----------
+        electrode_codes : array-like
+            Electrode code of each ``(electrode, channel)`` pair.  Pairs with
+            negative codes (i.e., unknown electrodes) are ignored.
+        channels : array-like
+            Channel of each ``(electrode, channel)`` pair.
+        electrode_count : int
+            Number of electrode codes.
+        '''
+        electrode_codes = np.asarray(electrode_codes, dtype=np.int64)
+        channels = np.asarray(channels, dtype=np.int64)
+        channel_count = channels.max() + 1 if channels.shape[0] else 0
+        valid = electrode_codes >= 0
+        electrode_codes = electrode_codes[valid]
+        channels = channels[valid]
+
+        order = np.argsort(electrode_codes, kind='mergesort')
+        self.electrode_indptr = _indptr(electrode_codes, electrode_count)
+        self.electrode_channels = channels[order]
+        order = np.argsort(channels, kind='mergesort')
+        self.channel_indptr = _indptr(channels, channel_count)
+        self.channel_electrodes = electrode_codes[order]
+
+    @property
+    def channel_count(self):
+        return self.channel_indptr.shape[0] - 1
+
+    def channels(self, electrode_codes):
+        '''
+        Parameters
+        ----------
+        electrode_codes : array-like
+            Electrode codes.
+
+        Returns
+        -------
+        (electrode_codes, channels) : (numpy.ndarray, numpy.ndarray)
+            Electrode code and channel of each ``(electrode, channel)`` pair
+            of the electrodes, in order of the electrodes.  Electrodes without
+            channels are omitted.
+        '''
+        return _gather(self.electrode_indptr, self.electrode_channels,
+                       electrode_codes)
+
+    def electrodes(self, channels):
+        '''
+        Parameters
+        ----------
+        channels : array-like
+            Channels.
+
+        Returns
+        -------
+        (channels, electrode_codes) : (numpy.ndarray, numpy.ndarray)
+            Channel and electrode code of each ``(electrode, channel)`` pair
+            of the channels, in order of the channels.  Channels without
+            electrodes are omitted.
+        '''
+        return _gather(self.channel_indptr, self.channel_electrodes,
+                       channels)
+
+    def channel_states(self, electrode_codes):
+        '''
+        Parameters
+        ----------
+        electrode_codes : array-like
+            Two-dimensional array of actuated electrode codes, one row per
+            set of channel states.
+
+        Returns
+        -------
+        numpy.ndarray
+            Boolean actuation state of each channel (column) for each row of
+            electrodes, where channels connected to actuated electrodes are
+            ``True``.
+        '''
+        electrode_codes = np.atleast_2d(np.asarray(electrode_codes,
+                                                   dtype=np.int64))
+        rows = np.repeat(np.arange(electrode_codes.shape[0]),
+                         electrode_codes.shape[1])
+        codes = electrode_codes.ravel()
+        valid = (codes >= 0) & (codes < self.electrode_indptr.shape[0] - 1)
+        rows, codes = rows[valid], codes[valid]
+        counts = (self.electrode_indptr[codes + 1] -
+                  self.electrode_indptr[codes])
+        states = np.zeros((electrode_codes.shape[0], self.channel_count),
+                          dtype=bool)
+        states[np.repeat(rows, counts), self.channels(codes)[1]] = True
+        return states
+
+
+def _indptr(keys, key_count):
+    return np.concatenate([[0], np.cumsum(np.bincount(keys,
+                                                      minlength=key_count))])
+
+
+def _gather(indptr, values, keys):
+    '''
+    Look up CSR rows of keys (keys out of range are ignored).
+
+    Returns
+    -------
+    (keys, values) : (numpy.ndarray, numpy.ndarray)
+        Key and value of each entry of the rows of keys, in order of keys.
+    '''
+    keys = np.asarray(keys, dtype=np.int64).ravel()
+    keys = keys[(keys >= 0) & (keys < indptr.shape[0] - 1)]
+    positions, counts = csr_positions(indptr, keys)
+    return np.repeat(keys, counts), values[positions]
+
+
+class ActuationAreas(object):
+    '''
+    Precomputed electrode areas per channel, to compute the total area of
+    actuated electrodes for channel states without any label lookups.
+
+    Electrodes connected to a single channel are accumulated into a dense
+    vector of area per channel, such that their actuated area is a dot
+    product with the actuated channel mask.  Electrodes connected to multiple
+    channels are stored separately and counted *once* if any of their
+    channels is actuated.
+
+    Attributes
+    ----------
+    channel_areas : numpy.ndarray
+        Total area of single-channel electrodes connected to each channel,
+        indexed by channel.
+    shared_channels : numpy.ndarray
+        Channel of each (electrode, channel) pair of multi-channel electrodes,
+        grouped by electrode.
+    shared_electrodes : numpy.ndarray
+        Multi-channel electrode code of each pair in :attr:`shared_channels`
+        (in increasing order).
+    shared_starts : numpy.ndarray
+        Position of the first pair of each multi-channel electrode in
+        :attr:`shared_channels`.
+    shared_areas : numpy.ndarray
+        Area of each multi-channel electrode, indexed by code.
+    '''
+    def __init__(self, df_electrode_channels, electrode_areas):
+        '''
+        Parameters
+        ----------
+        df_electrode_channels : pandas.DataFrame
+            Frame with the columns ``electrode_id`` and ``channel``, one row
+            per channel connected to an electrode.
+        electrode_areas : pandas.Series
+            Area of each electrode, indexed by electrode identifier.
+        '''
+        electrode_ids = df_electrode_channels['electrode_id']
+        channels = df_electrode_channels['channel'].values.astype(int)
+        areas = electrode_areas.reindex(electrode_ids.values).fillna(0).values
+        single = (electrode_ids.map(electrode_ids.value_counts()) == 1).values
+
+        channel_count = channels.max() + 1 if channels.shape[0] else 0
+        self.channel_areas = np.bincount(channels[single],
+                                         weights=areas[single],
+                                         minlength=channel_count)
+        shared_electrodes, shared_ids = \
+            pd.factorize(electrode_ids.values[~single])
+        # Group pairs by electrode, such that hits of the pairs of each
+        # electrode may be reduced with `reduceat`.
+        order = np.argsort(shared_electrodes, kind='mergesort')
+        self.shared_channels = channels[~single][order]
+        self.shared_electrodes = shared_electrodes[order]
+        self.shared_starts = np.searchsorted(self.shared_electrodes,
+                                             np.arange(len(shared_ids)))
+        self.shared_areas = (electrode_areas.reindex(shared_ids).fillna(0)
+                             .values)
+
+    def actuated_area(self, state_of_all_channels):
+        '''
+        Parameters
+        ----------
+        state_of_all_channels : array-like
+            Actuation level of each channel.  Any level greater than zero is
+            considered actuated.
+
+        Returns
+        -------
+        float
+            Total area of actuated electrodes.
+        '''
+        actuated = np.asarray(state_of_all_channels).ravel() > 0
+        channel_count = min(actuated.shape[0], self.channel_areas.shape[0])
+        area = self.channel_areas[:channel_count].dot(actuated[:channel_count])
+        if self.shared_areas.shape[0] > 0:
+            # Count each multi-channel electrode if any of its channels is
+            # actuated.
+            in_range = self.shared_channels < actuated.shape[0]
+            hits = np.bincount(self.shared_electrodes[in_range],
+                               weights=actuated[self.shared_channels
+                                                [in_range]],
+                               minlength=self.shared_areas.shape[0])
+            area += self.shared_areas[hits > 0].sum()
+        return float(area)
+
+    def actuated_areas(self, states, chunk_size=None):
+        '''
+        Compute total area of actuated electrodes for multiple sets of channel
+        states at once (e.g., for each step of a protocol, or for each sample
+        of a recorded actuation log).
+
+        Parameters
+        ----------
+        states : array-like, scipy.sparse matrix or iterable
+            Actuation level of each channel (columns) for each set of states
+            (rows).  Any level greater than zero is considered actuated.
+            May be a dense array (including :class:`numpy.memmap`), a
+            :mod:`scipy.sparse` matrix, or an iterator of such 2-D chunks.
+        chunk_size : int, optional
+            Number of rows to process at a time (default: all rows).
+
+        Returns
+        -------
+        numpy.ndarray
+            Total area of actuated electrodes for each row of states.
+        '''
+        if isinstance(states, (list, tuple)):
+            states = np.asarray(states)
+        if not hasattr(states, 'shape'):
+            # Iterable (e.g., generator) of chunks.
+            areas = [self.actuated_areas(chunk, chunk_size=chunk_size)
+                     for chunk in states]
+            return np.concatenate(areas) if areas else np.zeros(0)
+
+        if hasattr(states, 'tocsr'):
+            # Sparse matrix; use row-sliceable format.
+            states = states.tocsr()
+        elif np.ndim(states) != 2:
+            states = np.atleast_2d(np.asarray(states))
+
+        row_count = states.shape[0]
+        if chunk_size is None:
+            chunk_size = max(row_count, 1)
+        areas = np.zeros(row_count)
+        for start in range(0, row_count, chunk_size):
+            end = min(start + chunk_size, row_count)
+            areas[start:end] = self._chunk_actuated_areas(states[start:end])
+        return areas
+
+    def _chunk_actuated_areas(self, states):
+        if hasattr(states, 'tocsr'):
+            actuated = states > 0
+        else:
+            actuated = np.asarray(states) > 0
+        channel_count = min(actuated.shape[1], self.channel_areas.shape[0])
+        areas = actuated[:, :channel_count].dot(self.channel_areas
+                                                [:channel_count])
+        areas = np.asarray(areas, dtype=float).ravel()
+        if self.shared_areas.shape[0] > 0:
+            # Count each multi-channel electrode if any of its channels is
+            # actuated.
+            in_range = self.shared_channels < actuated.shape[1]
+            in_range_hits = actuated[:, self.shared_channels[in_range]]
+            if hasattr(in_range_hits, 'toarray'):
+                in_range_hits = in_range_hits.toarray()
+            hits = np.zeros((actuated.shape[0],
+                             self.shared_channels.shape[0]), dtype=bool)
+            hits[:, in_range] = in_range_hits
+            electrode_hits = np.logical_or.reduceat(hits, self.shared_starts,
+                                                    axis=1)
+            areas += electrode_hits.dot(self.shared_areas)
+        return areas
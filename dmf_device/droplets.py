@@ -0,0 +1,306 @@
+'''
+Simultaneous routing of multiple droplets on a device.
+
+Droplets on adjacent electrodes merge, so at each step of a route no two
+droplets may occupy the same electrode or neighbouring electrodes.  In
+addition, no droplet may occupy (or neighbour) an electrode occupied by
+another droplet in the previous step, such that droplets never come into
+contact while moving.
+
+Routes are planned one droplet at a time (prioritized planning), using A*
+search in space-time (i.e., over ``(electrode, step)`` states).  Each planned
+route is added to a reservation table that the search for each subsequent
+droplet must avoid.
+'''
+import heapq
+
+import networkx as nx
+import numpy as np
+
+
+class NoRouteError(nx.NetworkXNoPath):
+    '''
+    Raised if no route satisfying the droplet separation constraints was
+    found.
+    '''
+    pass
+
+
+class Reservations(object):
+    '''
+    Electrodes reserved by planned droplet routes at each step.
+
+    The neighbourhood (i.e., the electrode itself and its neighbours) of each
+    electrode along a route is reserved.  After a droplet reaches the end of
+    its route, the neighbourhood of its final electrode remains reserved
+    indefinitely.
+
+    Attributes
+    ----------
+    blocked : list
+        Set of reserved electrode codes, indexed by step.
+    permanent : dict
+        First step of indefinite reservation, keyed by electrode code.
+    '''
+    def __init__(self, neighborhoods):
+        '''
+        Parameters
+        ----------
+        neighborhoods : list
+            Codes of each electrode and its neighbours, indexed by electrode
+            code.
+        '''
+        self.neighborhoods = neighborhoods
+        self.blocked = []
+        self.permanent = {}
+
+    @property
+    def horizon(self):
+        '''
+        First step after which reservations no longer change.
+        '''
+        return max([len(self.blocked)] + list(self.permanent.values()))
+
+    def add(self, route, permanent=True):
+        '''
+        Parameters
+        ----------
+        route : list
+            Electrode code at each step.
+        permanent : bool, optional
+            If ``True`` (default), keep final electrode reserved after the
+            last step of the route.
+        '''
+        while len(self.blocked) < len(route):
+            self.blocked.append(set())
+        for step, node in enumerate(route):
+            self.blocked[step].update(self.neighborhoods[node])
+        if permanent:
+            end = len(route) - 1
+            for node in self.neighborhoods[route[-1]]:
+                self.permanent[node] = min(self.permanent.get(node, end),
+                                           end)
+
+    def is_blocked(self, node, step):
+        '''
+        Returns
+        -------
+        bool
+            ``True`` if electrode is reserved at step.
+        '''
+        if step < len(self.blocked) and node in self.blocked[step]:
+            return True
+        return node in self.permanent and step >= self.permanent[node]
+
+    def last_blocked(self, node):
+        '''
+        Returns
+        -------
+        int
+            Last step at which electrode is reserved (-1 if never).
+        '''
+        for step in range(len(self.blocked) - 1, -1, -1):
+            if node in self.blocked[step]:
+                return step
+        return -1
+
+
+class DropletRouter(object):
+    '''
+    Prioritized multi-droplet router on a
+    :class:`dmf_device.graph.CsrGraph`.
+
+    Each step, a droplet either stays on its electrode or moves to a
+    neighbouring electrode.
+    '''
+    def __init__(self, graph):
+        '''
+        Parameters
+        ----------
+        graph : dmf_device.graph.CsrGraph
+            Connection graph.
+        '''
+        self.graph = graph
+        indptr = graph.indptr.tolist()
+        indices = graph.indices.tolist()
+        self.neighbors = [indices[indptr[i]:indptr[i + 1]]
+                          for i in range(graph.node_count)]
+        self.neighborhoods = [[i] + neighbors_i
+                              for i, neighbors_i in enumerate(self.neighbors)]
+
+    def check_separation(self, nodes, label):
+        '''
+        Raises
+        ------
+        ValueError
+            If any two electrodes are the same or adjacent.
+        '''
+        nodes = list(nodes)
+        occupied = {}
+        for i, node in enumerate(nodes):
+            for node_j in self.neighborhoods[node]:
+                if node_j in occupied:
+                    raise ValueError('%s electrodes of droplets %d and %d are '
+                                     'the same or adjacent.' %
+                                     (label, occupied[node_j], i))
+            occupied[node] = i
+
+    def route(self, sources, targets, order=None, max_steps=None):
+        '''
+        Plan simultaneous routes of droplets from source to target electrodes.
+
+        Parameters
+        ----------
+        sources, targets : list
+            Codes of source and target electrode of each droplet.
+        order : list, optional
+            Initial order in which to plan droplet routes, i.e., priority.  By
+            default, droplets with the longest distance to travel are planned
+            first.  If no route is found for a droplet, planning is restarted
+            with that droplet at highest priority.
+        max_steps : int, optional
+            Maximum number of steps of each route (default: number of
+            electrodes plus the length of longer priority routes).
+
+        Returns
+        -------
+        numpy.ndarray
+            Electrode code of each droplet (column) at each step (row).  The
+            first row holds the source electrodes and the last row holds the
+            target electrodes.
+
+        Raises
+        ------
+        NoRouteError
+            If no route was found for a droplet in any planning order tried.
+            Note that prioritized planning is not complete, i.e., routes may
+            exist even if none were found.
+        '''
+        sources = [int(node) for node in sources]
+        targets = [int(node) for node in targets]
+        if len(sources) != len(targets):
+            raise ValueError('Number of sources and targets differ.')
+        self.check_separation(sources, 'Source')
+        self.check_separation(targets, 'Target')
+
+        distances = [self.graph.bfs(target)[0] for target in targets]
+        if order is None:
+            order = sorted(range(len(sources)),
+                           key=lambda i: -distances[i][sources[i]])
+
+        order = list(order)
+        for attempt in range(len(order) + 1):
+            routes, failed = self._route_all(sources, targets, distances,
+                                             order, max_steps)
+            if failed is None:
+                break
+            elif failed == order[0]:
+                # Route not found even at highest priority.
+                raise NoRouteError('No route found for droplet %d.' % failed)
+            # Retry with failed droplet at highest priority.
+            order.remove(failed)
+            order.insert(0, failed)
+        else:
+            raise NoRouteError('No route found for droplet %d.' % failed)
+
+        step_count = max([1] + [len(route_i) for route_i in routes])
+        positions = np.empty((step_count, len(routes)),
+                             dtype=self.graph.indices.dtype)
+        for i, route_i in enumerate(routes):
+            positions[:len(route_i), i] = route_i
+            positions[len(route_i):, i] = route_i[-1]
+        return positions
+
+    def _route_all(self, sources, targets, distances, order, max_steps):
+        '''
+        Plan route of each droplet in order, avoiding routes of droplets
+        planned before.
+
+        Returns
+        -------
+        (routes, failed) : (list, int)
+            Route of each droplet (``None`` if not planned), and index of
+            droplet for which no route was found (``None`` if all droplets
+            were routed).
+        '''
+        reservations = Reservations(self.neighborhoods)
+        routes = [None] * len(sources)
+        for i in order:
+            # Droplets without a planned route stay at their source until
+            # planned, at least for the first step.
+            waiting = Reservations(self.neighborhoods)
+            for j, source_j in enumerate(sources):
+                if j != i and routes[j] is None:
+                    waiting.add([source_j], permanent=False)
+            route_i = self._route(sources[i], targets[i],
+                                  distances[i].tolist(), reservations,
+                                  waiting, max_steps)
+            if route_i is None:
+                return routes, i
+            routes[i] = route_i
+            reservations.add(route_i)
+        return routes, None
+
+    def _route(self, source, target, distances, reservations, waiting,
+               max_steps):
+        '''
+        Space-time A* search from source to target, avoiding reserved
+        electrodes.
+
+        The hop distance to the target (ignoring reservations) is used as
+        heuristic.
+
+        Returns
+        -------
+        list or None
+            Electrode code at each step, or ``None`` if no route was found.
+        '''
+        if distances[source] < 0:
+            return None
+
+        def is_free(node, step):
+            # Electrode must be free at the step, and at the previous and next
+            # steps (i.e., while this droplet or other droplets move).
+            return not any(reservations.is_blocked(node, step_i) or
+                           waiting.is_blocked(node, step_i)
+                           for step_i in (step - 1, step, step + 1))
+
+        horizon = max(reservations.horizon, waiting.horizon)
+        if max_steps is None:
+            max_steps = horizon + len(self.neighbors)
+        # Target must remain free after the route ends.
+        last_blocked = max(reservations.last_blocked(target),
+                           waiting.last_blocked(target))
+        arrival = last_blocked + 2 if last_blocked >= 0 else 0
+
+        predecessors = {(source, 0): None}
+        # Beyond the horizon, states at the same electrode are equivalent.
+        visited = set()
+        heap = [(distances[source], 0, source)]
+        while heap:
+            estimate, step, node = heapq.heappop(heap)
+            key = (node, min(step, horizon))
+            if key in visited:
+                continue
+            visited.add(key)
+            if node == target and step >= arrival:
+                route = [node]
+                state = (node, step)
+                while predecessors[state] is not None:
+                    state = predecessors[state]
+                    route.append(state[0])
+                return route[::-1]
+            if step >= max_steps:
+                continue
+            next_step = step + 1
+            for next_node in self.neighborhoods[node]:
+                if distances[next_node] < 0 or \
+                        (next_node, min(next_step, horizon)) in visited or \
+                        not is_free(next_node, next_step):
+                    continue
+                state = (next_node, next_step)
+                if state not in predecessors:
+                    predecessors[state] = (node, step)
+                    heapq.heappush(heap, (next_step + distances[next_node],
+                                          next_step, next_node))
+        return None
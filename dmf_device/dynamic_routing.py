@@ -0,0 +1,326 @@
+'''
+Shortest path search that is repaired incrementally as electrodes or
+connections are blocked, unblocked, or change cost.
+
+Uses Lifelong Planning A* (LPA*) [1]_, which reuses the results of the
+previous search such that re-planning after a small change only touches the
+part of the graph affected by the change.
+
+.. [1] Koenig, S., Likhachev, M. and Furcy, D., "Lifelong Planning A*",
+   Artificial Intelligence, 155(1-2), pp. 93-146, 2004.
+'''
+import bisect
+import heapq
+
+import numpy as np
+
+from .routing import edge_lengths
+
+
+INF = float('inf')
+
+
+class LpaStar(object):
+    '''
+    Lifelong Planning A* search for a path between a fixed source and target
+    on a :class:`dmf_device.graph.CsrGraph` with mutable edge costs.
+
+    Edge costs default to the Euclidean distance between the coordinates of
+    the end points.  The straight-line distance to the target, scaled down if
+    necessary to stay below the lowest cost to length ratio of any edge, is
+    used as search heuristic.
+
+    Attributes
+    ----------
+    source, target : int
+        Codes of source and target nodes.
+    blocked_nodes : set
+        Codes of blocked nodes.
+    '''
+    def __init__(self, graph, coordinates, source, target):
+        '''
+        Parameters
+        ----------
+        graph : dmf_device.graph.CsrGraph
+            Connection graph.
+        coordinates : numpy.ndarray
+            ``(x, y)`` coordinates of each node, one row per node code.
+        source, target : int
+            Codes of source and target nodes.
+        '''
+        self.source = int(source)
+        self.target = int(target)
+        coordinates = np.asarray(coordinates, dtype=float)
+        self._indptr = graph.indptr.tolist()
+        self._indices = graph.indices.tolist()
+        sources = np.repeat(np.arange(graph.node_count), graph.degree())
+        self._lengths = edge_lengths(coordinates, sources,
+                                     graph.indices).tolist()
+        # Cost of each edge, ignoring blocked nodes (`INF` if edge is
+        # blocked).
+        self._edge_costs = list(self._lengths)
+        # Effective cost of each neighbour entry (`INF` if edge or either end
+        # point is blocked).
+        self._costs = list(self._lengths)
+        self.blocked_nodes = set()
+        target_x, target_y = coordinates[self.target]
+        self._distances = np.hypot(coordinates[:, 0] - target_x,
+                                   coordinates[:, 1] - target_y).tolist()
+        self._heuristic_scale = 1.
+        self.reset()
+
+    def reset(self):
+        '''
+        Discard all search state (the next search starts from scratch).
+        '''
+        node_count = len(self._indptr) - 1
+        self._g = [INF] * node_count
+        self._rhs = [INF] * node_count
+        self._rhs[self.source] = 0.
+        # Current key of each queued node; heap entries with a different key
+        # are stale.
+        self._queued = {}
+        self._heap = []
+        self._push(self.source)
+
+    def _key(self, node):
+        g = min(self._g[node], self._rhs[node])
+        return (g + self._heuristic_scale * self._distances[node], g)
+
+    def _push(self, node):
+        key = self._key(node)
+        self._queued[node] = key
+        heapq.heappush(self._heap, (key, node))
+
+    @staticmethod
+    def _key_below(key, bound):
+        # Keys that are equal up to rounding errors (e.g., of costs summed
+        # along different paths) are not below each other in exact
+        # arithmetic, but the node must still be expanded; otherwise, the
+        # search may stop before the (stale) cost of the target is raised.
+        tolerance = 1e-9 * max(1., abs(bound[0]))
+        return key[0] < bound[0] + tolerance
+
+    def _top_key(self):
+        heap = self._heap
+        while heap and self._queued.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else (INF, INF)
+
+    def _update_node(self, node):
+        if node != self.source:
+            g, costs, indices = self._g, self._costs, self._indices
+            self._rhs[node] = min([g[indices[k]] + costs[k]
+                                   for k in range(self._indptr[node],
+                                                  self._indptr[node + 1])] +
+                                  [INF])
+        self._queued.pop(node, None)
+        if self._g[node] != self._rhs[node]:
+            self._push(node)
+
+    def _neighbors(self, node):
+        return self._indices[self._indptr[node]:self._indptr[node + 1]]
+
+    def compute(self):
+        '''
+        Update search state to reflect all changes since the last search.
+        '''
+        g, rhs, target = self._g, self._rhs, self.target
+        while (self._key_below(self._top_key(), self._key(target)) or
+               rhs[target] != g[target]):
+            if not self._heap:
+                break
+            key, node = heapq.heappop(self._heap)
+            del self._queued[node]
+            if g[node] > rhs[node]:
+                g[node] = rhs[node]
+                for neighbour in self._neighbors(node):
+                    self._update_node(neighbour)
+            else:
+                g[node] = INF
+                self._update_node(node)
+                for neighbour in self._neighbors(node):
+                    self._update_node(neighbour)
+
+    def shortest_path(self):
+        '''
+        Returns
+        -------
+        list or None
+            Codes of nodes on shortest path from source to target, or ``None``
+            if target is not reachable from source.
+        '''
+        self.compute()
+        g, costs, indices = self._g, self._costs, self._indices
+        if g[self.target] == INF or self._rhs[self.target] == INF:
+            return None
+        path = [self.target]
+        visited = set(path)
+        while path[-1] != self.source:
+            node = path[-1]
+            # Predecessor minimizes cost to reach node.
+            k = min(range(self._indptr[node], self._indptr[node + 1]),
+                    key=lambda k: g[indices[k]] + costs[k])
+            predecessor = indices[k]
+            if g[predecessor] == INF or predecessor in visited:
+                # Search state does not describe a path to the source.
+                return None
+            visited.add(predecessor)
+            path.append(predecessor)
+        return path[::-1]
+
+    def path_cost(self):
+        '''
+        Returns
+        -------
+        float
+            Cost of shortest path from source to target (infinite if target
+            is not reachable from source).
+        '''
+        self.compute()
+        return self._g[self.target]
+
+    def _entries(self, node_a, node_b):
+        # Positions of neighbour entries of edge in both directions.
+        positions = []
+        for node_i, node_j in ((node_a, node_b), (node_b, node_a)):
+            start, end = self._indptr[node_i], self._indptr[node_i + 1]
+            k = bisect.bisect_left(self._indices, node_j, start, end)
+            if k == end or self._indices[k] != node_j:
+                raise KeyError('Nodes %s and %s are not connected.' %
+                               (node_a, node_b))
+            positions.append(k)
+        return positions
+
+    def _refresh(self, node_a, node_b, positions):
+        blocked = (node_a in self.blocked_nodes or
+                   node_b in self.blocked_nodes)
+        for k in positions:
+            self._costs[k] = INF if blocked else self._edge_costs[k]
+
+    def set_edge_cost(self, node_a, node_b, cost):
+        '''
+        Parameters
+        ----------
+        node_a, node_b : int
+            Codes of edge end points.
+        cost : float
+            Edge cost (``None`` to restore the default cost, i.e., the
+            distance between end points; infinite to block edge).
+        '''
+        positions = self._entries(node_a, node_b)
+        if cost is not None and cost < 0:
+            raise ValueError('Edge cost must not be negative.')
+        if cost is None:
+            cost = self._lengths[positions[0]]
+        elif cost < self._lengths[positions[0]] * self._heuristic_scale:
+            # Heuristic must not overestimate path costs, so the search state
+            # is no longer valid.
+            self._heuristic_scale = cost / self._lengths[positions[0]]
+            for k in positions:
+                self._edge_costs[k] = cost
+            self._refresh(node_a, node_b, positions)
+            self.reset()
+            return
+        for k in positions:
+            self._edge_costs[k] = cost
+        self._refresh(node_a, node_b, positions)
+        self._update_node(node_a)
+        self._update_node(node_b)
+
+    def set_nodes_blocked(self, nodes, blocked=True):
+        '''
+        Parameters
+        ----------
+        nodes : list
+            Node codes.
+        blocked : bool, optional
+            If ``True`` (default), block nodes.  Otherwise, unblock nodes.
+        '''
+        nodes = set(int(node) for node in nodes)
+        if blocked:
+            nodes.difference_update(self.blocked_nodes)
+            self.blocked_nodes.update(nodes)
+        else:
+            nodes.intersection_update(self.blocked_nodes)
+            self.blocked_nodes.difference_update(nodes)
+        affected = set(nodes)
+        for node in nodes:
+            for neighbour in self._neighbors(node):
+                self._refresh(node, neighbour,
+                              self._entries(node, neighbour))
+                affected.add(neighbour)
+        for node in affected:
+            self._update_node(node)
+
+
+class PathPlanner(object):
+    '''
+    Incrementally repaired shortest path between two electrodes (see
+    :class:`LpaStar`), where electrodes and connections may be blocked,
+    unblocked, or change cost.
+    '''
+    def __init__(self, lpa_star, shape_ids):
+        '''
+        Parameters
+        ----------
+        lpa_star : LpaStar
+            Search on integer node codes.
+        shape_ids : numpy.ndarray
+            Electrode identifier of each node code.
+        '''
+        self.lpa_star = lpa_star
+        self.shape_ids = shape_ids
+        self.shape_codes = dict((shape_id, code)
+                                for code, shape_id in enumerate(shape_ids))
+
+    def _codes(self, electrode_ids):
+        return [self.shape_codes[electrode_id]
+                for electrode_id in electrode_ids]
+
+    @property
+    def blocked_electrodes(self):
+        return sorted(self.shape_ids[code]
+                      for code in self.lpa_star.blocked_nodes)
+
+    def block_electrodes(self, electrode_ids):
+        self.lpa_star.set_nodes_blocked(self._codes(electrode_ids))
+
+    def unblock_electrodes(self, electrode_ids):
+        self.lpa_star.set_nodes_blocked(self._codes(electrode_ids),
+                                        blocked=False)
+
+    def set_connection_cost(self, electrode_a, electrode_b, cost):
+        '''
+        Parameters
+        ----------
+        electrode_a, electrode_b : str
+            Identifiers of connected electrodes.
+        cost : float
+            Connection cost (``None`` to restore the default cost, i.e., the
+            distance between electrode centers).
+        '''
+        node_a, node_b = self._codes([electrode_a, electrode_b])
+        self.lpa_star.set_edge_cost(node_a, node_b, cost)
+
+    def block_connection(self, electrode_a, electrode_b):
+        self.set_connection_cost(electrode_a, electrode_b, INF)
+
+    def unblock_connection(self, electrode_a, electrode_b):
+        self.set_connection_cost(electrode_a, electrode_b, None)
+
+    def find_path(self):
+        '''
+        Returns
+        -------
+        list or None
+            Identifiers of electrodes on shortest path from source to target,
+            or ``None`` if target is not reachable from source.
+        '''
+        path = self.lpa_star.shortest_path()
+        if path is None:
+            return None
+        return self.shape_ids[path].tolist()
+
+    def path_cost(self):
+        return self.lpa_star.path_cost()
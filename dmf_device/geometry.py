@@ -0,0 +1,124 @@
+'''
+Vectorized per-polygon geometry.
+'''
+import numpy as np
+import pandas as pd
+
+
+def next_vertices(vertex_indptr):
+    '''
+    Parameters
+    ----------
+    vertex_indptr : numpy.ndarray
+        Offset of the vertices of each polygon in an array of vertices
+        ordered by polygon (length is number of polygons + 1).
+
+    Returns
+    -------
+    numpy.ndarray
+        Index of vertex following each vertex within its polygon (the first
+        vertex follows the last).
+    '''
+    vertex_counts = np.diff(vertex_indptr)
+    nonempty = vertex_counts > 0
+    next_vertex = np.arange(vertex_indptr[-1]) + 1
+    next_vertex[vertex_indptr[1:][nonempty] - 1] = vertex_indptr[:-1][nonempty]
+    return next_vertex
+
+
+def ordered_vertices(df_shapes, shape_i_column='id'):
+    '''
+    Order polygon vertices by (sorted) polygon identifier.
+
+    Parameters
+    ----------
+    df_shapes : pandas.DataFrame
+        Frame with one row per polygon vertex, with the columns ``x``, ``y``
+        and :data:`shape_i_column`, ordered by vertex within each polygon.
+    shape_i_column : str, optional
+        Column identifying the polygon of each vertex.
+
+    Returns
+    -------
+    (shape_ids, codes, x, y, starts, vertex_counts, next_vertex) : tuple
+        Sorted polygon identifiers, polygon code and coordinates of each
+        vertex (ordered by polygon), offset of the first vertex and number of
+        vertices of each polygon, and index of the vertex following each
+        vertex within its polygon (see :func:`next_vertices`).  Vertices
+        without polygon identifier are ignored.
+    '''
+    codes, shape_ids = pd.factorize(df_shapes[shape_i_column], sort=True)
+    valid = np.nonzero(codes >= 0)[0]
+    order = valid[np.argsort(codes[valid], kind='mergesort')]
+    codes = codes[order]
+    x = df_shapes['x'].values[order].astype(float)
+    y = df_shapes['y'].values[order].astype(float)
+    vertex_counts = np.bincount(codes, minlength=len(shape_ids))
+    vertex_indptr = np.append(0, np.cumsum(vertex_counts))
+    return (shape_ids, codes, x, y, vertex_indptr[:-1], vertex_counts,
+            next_vertices(vertex_indptr))
+
+
+def polygon_geometry(df_shapes, shape_i_column='id'):
+    '''
+    Compute geometry of each polygon in one vectorized pass over all
+    vertices.
+
+    Parameters
+    ----------
+    df_shapes : pandas.DataFrame
+        Frame with one row per polygon vertex, with the columns ``x``, ``y``
+        and :data:`shape_i_column`, ordered by vertex within each polygon.
+    shape_i_column : str, optional
+        Column identifying the polygon of each vertex.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Frame indexed by (sorted) polygon identifier, with the columns:
+
+         - ``area``: area (shoelace formula),
+         - ``perimeter``: length of polygon boundary,
+         - ``x_min``, ``y_min``, ``x_max``, ``y_max``: bounding box,
+         - ``x_centroid``, ``y_centroid``: centroid of polygon area (mean of
+           vertices for polygons without area),
+         - ``vertex_count``: number of vertices.
+    '''
+    (shape_ids, codes, x, y, starts, vertex_counts,
+     next_vertex) = ordered_vertices(df_shapes, shape_i_column)
+    x_next, y_next = x[next_vertex], y[next_vertex]
+
+    def polygon_sum(values):
+        return np.bincount(codes, weights=values, minlength=len(shape_ids))
+
+    cross = x * y_next - x_next * y
+    signed_area = .5 * polygon_sum(cross)
+    perimeter = polygon_sum(np.hypot(x_next - x, y_next - y))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_centroid = polygon_sum((x + x_next) * cross) / (6 * signed_area)
+        y_centroid = polygon_sum((y + y_next) * cross) / (6 * signed_area)
+    degenerate = ~np.isfinite(x_centroid) | ~np.isfinite(y_centroid)
+    if degenerate.any():
+        x_centroid[degenerate] = (polygon_sum(x) /
+                                  vertex_counts)[degenerate]
+        y_centroid[degenerate] = (polygon_sum(y) /
+                                  vertex_counts)[degenerate]
+
+    if x.shape[0]:
+        bounds = [np.minimum.reduceat(x, starts),
+                  np.minimum.reduceat(y, starts),
+                  np.maximum.reduceat(x, starts),
+                  np.maximum.reduceat(y, starts)]
+    else:
+        bounds = [np.zeros(0)] * 4
+    index = pd.Index(shape_ids, name=shape_i_column)
+    return pd.DataFrame({'area': np.abs(signed_area),
+                         'perimeter': perimeter,
+                         'x_min': bounds[0], 'y_min': bounds[1],
+                         'x_max': bounds[2], 'y_max': bounds[3],
+                         'x_centroid': x_centroid,
+                         'y_centroid': y_centroid,
+                         'vertex_count': vertex_counts}, index=index,
+                        columns=['area', 'perimeter', 'x_min', 'y_min',
+                                 'x_max', 'y_max', 'x_centroid',
+                                 'y_centroid', 'vertex_count'])
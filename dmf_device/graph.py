@@ -0,0 +1,319 @@
+'''
+Compact integer-indexed representations of electrode connection graphs.
+'''
+import numpy as np
+import pandas as pd
+
+
+def concatenated_ranges(starts, counts):
+    '''
+    Parameters
+    ----------
+    starts, counts : numpy.ndarray
+        Start and length of each range.
+
+    Returns
+    -------
+    numpy.ndarray
+        Concatenation of ``arange(start, start + count)`` for each range.
+    '''
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return offsets + np.arange(counts.sum())
+
+
+def csr_positions(indptr, keys):
+    '''
+    Parameters
+    ----------
+    indptr : numpy.ndarray
+        Offsets of rows of a compressed sparse row (CSR) array, i.e., entries
+        of row ``i`` are at positions ``indptr[i]:indptr[i + 1]``.
+    keys : numpy.ndarray
+        Rows to look up.
+
+    Returns
+    -------
+    (positions, counts) : (numpy.ndarray, numpy.ndarray)
+        Concatenated positions of the entries of each row, and number of
+        entries of each row.
+    '''
+    starts = indptr[keys]
+    counts = indptr[keys + 1] - starts
+    return concatenated_ranges(starts, counts), counts
+
+
+def get_indexed_shapes(df_connected):
+    '''
+    Map zero-based integer indexes to connected shapes.
+
+    Shapes are indexed in sorted order of shape identifiers (consistent with
+    :func:`droplet_planning.connections.get_adjacency_matrix`).
+
+    Parameters
+    ----------
+    df_connected : pandas.DataFrame
+        Connections between shapes, with the columns ``source`` and
+        ``target``.
+
+    Returns
+    -------
+    pandas.Series
+        Shape identifiers, indexed by integer index.
+    '''
+    # Hash-based de-duplication before sorting is much faster than
+    # `np.unique` for string identifiers.
+    return pd.Series(np.sort(pd.unique(df_connected[['source', 'target']]
+                                       .values.ravel())))
+
+
+def edge_codes(df_connected, indexed_shapes):
+    '''
+    Parameters
+    ----------
+    df_connected : pandas.DataFrame
+        Connections between shapes, with the columns ``source`` and
+        ``target``.
+    indexed_shapes : pandas.Series
+        Shape identifiers indexed by integer index (see
+        :func:`get_indexed_shapes`).
+
+    Returns
+    -------
+    (sources, targets) : (numpy.ndarray, numpy.ndarray)
+        Integer index of source and target shape of each connection.
+    '''
+    shape_keys = pd.Index(indexed_shapes.values)
+    return tuple(shape_keys.get_indexer(df_connected[column].values)
+                 for column in ('source', 'target'))
+
+
+class CsrGraph(object):
+    '''
+    Immutable undirected graph stored in compressed sparse row (CSR) format.
+
+    Nodes are identified by zero-based integer codes.  The neighbours of node
+    ``i`` are ``indices[indptr[i]:indptr[i + 1]]``.
+
+    Attributes
+    ----------
+    indptr : numpy.ndarray
+        Offset of the neighbour list of each node in :attr:`indices` (length
+        is number of nodes + 1).
+    indices : numpy.ndarray
+        Concatenated (sorted) neighbour lists.
+    '''
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, sources, targets, node_count):
+        '''
+        Parameters
+        ----------
+        sources, targets : array-like
+            Integer codes of edge end points.  Duplicate edges and self loops
+            are ignored.
+        node_count : int
+            Number of nodes.
+
+        Returns
+        -------
+        CsrGraph
+        '''
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        # Add both directions of each edge.
+        rows = np.concatenate([sources, targets])
+        columns = np.concatenate([targets, sources])
+        keep = rows != columns
+        # Sort edges by (row, column) and drop duplicates.
+        keys = np.sort(rows[keep] * node_count + columns[keep])
+        keys = np.concatenate([keys[:1], keys[1:][keys[1:] != keys[:-1]]])
+        rows, columns = keys // node_count, keys % node_count
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+        return cls(indptr, columns.astype(index_dtype(node_count)))
+
+    @classmethod
+    def from_adjacency_matrix(cls, adjacency_matrix):
+        '''
+        Parameters
+        ----------
+        adjacency_matrix : numpy.ndarray
+            Square matrix where a non-zero $a_{i,j}$ indicates node $i$ is
+            connected to node $j$.
+
+        Returns
+        -------
+        CsrGraph
+        '''
+        sources, targets = np.nonzero(adjacency_matrix)
+        return cls.from_edges(sources, targets, adjacency_matrix.shape[0])
+
+    @property
+    def node_count(self):
+        return self.indptr.shape[0] - 1
+
+    @property
+    def edge_count(self):
+        return self.indices.shape[0] // 2
+
+    def degree(self):
+        '''
+        Returns
+        -------
+        numpy.ndarray
+            Number of neighbours of each node.
+        '''
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        '''
+        Returns
+        -------
+        numpy.ndarray
+            Integer codes of neighbours of node.
+        '''
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def edges(self):
+        '''
+        Returns
+        -------
+        (sources, targets) : (numpy.ndarray, numpy.ndarray)
+            End points of each edge, where ``source < target``.
+        '''
+        sources = np.repeat(np.arange(self.node_count), self.degree())
+        upper = sources < self.indices
+        return sources[upper], self.indices[upper]
+
+    def to_adjacency_matrix(self):
+        '''
+        Returns
+        -------
+        numpy.ndarray
+            Dense adjacency matrix.
+        '''
+        adjacency_matrix = np.zeros((self.node_count, ) * 2, dtype=int)
+        sources, targets = self.edges()
+        adjacency_matrix[sources, targets] = 1
+        adjacency_matrix[targets, sources] = 1
+        return adjacency_matrix
+
+    def bfs(self, source):
+        '''
+        Breadth-first search from source node.
+
+        Each level of the search is expanded at once using vectorized array
+        operations.
+
+        Parameters
+        ----------
+        source : int
+            Code of source node.
+
+        Returns
+        -------
+        (distances, predecessors) : (numpy.ndarray, numpy.ndarray)
+            Number of hops from source to each node and code of predecessor of
+            each node on a shortest path from source, respectively.  Both are
+            -1 for nodes not reachable from source (predecessor of source is
+            also -1).
+        '''
+        dtype = index_dtype(self.node_count)
+        distances = np.full(self.node_count, -1, dtype=dtype)
+        predecessors = np.full(self.node_count, -1, dtype=dtype)
+        distances[source] = 0
+        frontier = np.array([source])
+        distance = 0
+        while frontier.shape[0] > 0:
+            distance += 1
+            neighbors, parents = self._expand(frontier)
+            unvisited = distances[neighbors] < 0
+            neighbors, first = np.unique(neighbors[unvisited],
+                                         return_index=True)
+            distances[neighbors] = distance
+            predecessors[neighbors] = parents[unvisited][first]
+            frontier = neighbors
+        return distances, predecessors
+
+    def _expand(self, nodes):
+        '''
+        Returns
+        -------
+        (neighbors, parents) : (numpy.ndarray, numpy.ndarray)
+            Concatenated neighbours of nodes and the node each neighbour entry
+            belongs to.
+        '''
+        positions, counts = self.neighbor_positions(nodes)
+        return self.indices[positions], np.repeat(nodes, counts)
+
+    def neighbor_positions(self, nodes):
+        '''
+        Parameters
+        ----------
+        nodes : numpy.ndarray
+            Node codes.
+
+        Returns
+        -------
+        (positions, counts) : (numpy.ndarray, numpy.ndarray)
+            Concatenated positions of the neighbour entries of nodes in
+            :attr:`indices`, and number of neighbours of each node.
+        '''
+        return csr_positions(self.indptr, nodes)
+
+    def shortest_path(self, source, target):
+        '''
+        Parameters
+        ----------
+        source, target : int
+            Codes of source and target nodes.
+
+        Returns
+        -------
+        list or None
+            Codes of nodes on a path with the fewest hops from source to
+            target, or ``None`` if target is not reachable from source.
+        '''
+        distances, predecessors = self.bfs(source)
+        return path_from_predecessors(predecessors, source, target)
+
+
+def path_from_predecessors(predecessors, source, target):
+    '''
+    Parameters
+    ----------
+    predecessors : array-like
+        Code of predecessor of each node on shortest path from source.
+    source, target : int
+        Codes of source and target nodes.
+
+    Returns
+    -------
+    list or None
+        Codes of nodes on path from source to target, or ``None`` if target is
+        not reachable from source.
+    '''
+    path = [target]
+    while path[-1] != source:
+        predecessor = predecessors[path[-1]]
+        if predecessor < 0:
+            return None
+        path.append(predecessor)
+    return [int(node) for node in path[::-1]]
+
+
+def index_dtype(node_count):
+    '''
+    Returns
+    -------
+    numpy.dtype
+        Smallest signed integer type able to hold node codes (and -1).
+    '''
+    if node_count < np.iinfo(np.int16).max:
+        return np.dtype(np.int16)
+    elif node_count < np.iinfo(np.int32).max:
+        return np.dtype(np.int32)
+    return np.dtype(np.int64)
@@ -0,0 +1,52 @@
+'''
+Memoized, lazily evaluated attributes.
+'''
+
+
+class lazy_property(object):
+    '''
+    Decorator to define an attribute that is computed by the decorated method
+    on first access.
+
+    The computed value is stored in the instance ``__dict__`` under the name
+    of the method, such that subsequent accesses do not call the method
+    again.  Deleting the value from the instance ``__dict__`` (see
+    :func:`invalidate`) causes the value to be recomputed on next access.
+    '''
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.__name__] = self.func(instance)
+        return value
+
+
+def lazy_attributes(cls):
+    '''
+    Returns
+    -------
+    list
+        Names of all attributes of class defined using :class:`lazy_property`.
+    '''
+    return sorted(set(name for klass in cls.__mro__
+                      for name, value in vars(klass).items()
+                      if isinstance(value, lazy_property)))
+
+
+def invalidate(instance, names):
+    '''
+    Discard memoized values of lazy attributes.
+
+    Parameters
+    ----------
+    instance : object
+        Object with lazy attributes.
+    names : list
+        Names of lazy attributes to discard.
+    '''
+    for name in names:
+        instance.__dict__.pop(name, None)
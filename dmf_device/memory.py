@@ -0,0 +1,67 @@
+'''
+Estimate memory held by (nested) Python objects, e.g., to break down memory
+held by a device (see :meth:`dmf_device.DmfDevice.memory_report`).
+'''
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def nbytes(value, seen=None):
+    '''
+    Estimate number of bytes held by an object, including objects it refers
+    to (e.g., items of containers, attributes of instances, and elements of
+    object arrays).
+
+    Parameters
+    ----------
+    value : object
+        Object to measure.
+    seen : set, optional
+        Identifiers of objects (and array buffers) already measured, which
+        are not counted again.  Updated in place, such that memory shared
+        between several measured objects is counted once.
+
+    Returns
+    -------
+    int
+        Estimated number of bytes.
+
+    Notes
+    -----
+    Memory held by extension objects that do not report their size (e.g.,
+    parsed ``lxml`` documents) is not included.
+    '''
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    elif isinstance(value, np.ndarray):
+        # Views of the same buffer share memory, so count buffer once.
+        base = value
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        if base is not value:
+            if id(base) in seen:
+                return 0
+            seen.add(id(base))
+        size = base.nbytes
+        if value.dtype == object:
+            size += sum(nbytes(item, seen) for item in value.ravel())
+        return int(size)
+    elif isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(key, seen) +
+                                          nbytes(item, seen)
+                                          for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(nbytes(item, seen)
+                                          for item in value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + nbytes(vars(value), seen)
+    return sys.getsizeof(value)
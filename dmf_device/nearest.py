@@ -0,0 +1,139 @@
+'''
+Nearest neighbour queries on points (e.g., electrode centers).
+
+Uses :class:`scipy.spatial.cKDTree` if :mod:`scipy` is available; otherwise,
+falls back to vectorized brute force search (fast enough for devices with up
+to a few thousand electrodes).
+'''
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+class PointIndex(object):
+    '''
+    Index for k-nearest neighbour and radius queries on a set of points.
+
+    Attributes
+    ----------
+    points : numpy.ndarray
+        ``(x, y)`` coordinates of indexed points (one row per point).
+    '''
+    def __init__(self, points, use_kdtree=None, chunk_size=1024):
+        '''
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of points to index.
+        use_kdtree : bool, optional
+            If ``True``, use :class:`scipy.spatial.cKDTree`.  If ``False``,
+            use brute force search.  By default, a KD-tree is used if
+            :mod:`scipy` is available.
+        chunk_size : int, optional
+            Number of query points to process at a time in brute force
+            search (bounds memory use).
+        '''
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if use_kdtree is None:
+            use_kdtree = cKDTree is not None
+        elif use_kdtree and cKDTree is None:
+            raise ImportError('`scipy` is required to use a KD-tree.')
+        self._tree = cKDTree(self.points) if use_kdtree else None
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def query(self, points, k=1, max_distance=np.inf):
+        '''
+        Find nearest indexed points.
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of query points (one row per point).
+        k : int, optional
+            Number of nearest points to find for each query point.
+        max_distance : float, optional
+            Only find points within this distance.
+
+        Returns
+        -------
+        (distances, indexes) : (numpy.ndarray, numpy.ndarray)
+            Distance to and index of ``k`` nearest points (one row per query
+            point, in order of increasing distance).  Missing neighbours have
+            infinite distance and index -1.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self._tree is not None:
+            distances, indexes = self._tree.query(
+                points, k=k, distance_upper_bound=max_distance)
+            distances = np.asarray(distances).reshape(points.shape[0], k)
+            indexes = np.asarray(indexes).reshape(points.shape[0], k)
+            indexes = np.where(indexes < len(self), indexes, -1)
+            return distances, indexes
+
+        distances = np.full((points.shape[0], k), np.inf)
+        indexes = np.full((points.shape[0], k), -1, dtype=np.int64)
+        k_i = min(k, len(self))
+        for start in range(0, points.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, points.shape[0])
+            squared = self._squared_distances(points[start:end])
+            if k_i < len(self):
+                nearest = np.argpartition(squared, k_i - 1, axis=1)[:, :k_i]
+            else:
+                nearest = np.tile(np.arange(len(self)), (end - start, 1))
+            rows = np.arange(end - start)[:, None]
+            nearest_squared = squared[rows, nearest]
+            order = np.argsort(nearest_squared, axis=1, kind='mergesort')
+            distances[start:end, :k_i] = np.sqrt(nearest_squared[rows, order])
+            indexes[start:end, :k_i] = nearest[rows, order]
+        outside = distances > max_distance
+        distances[outside] = np.inf
+        indexes[outside] = -1
+        return distances, indexes
+
+    def query_radius(self, points, radius):
+        '''
+        Find all indexed points within radius of each query point.
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of query points (one row per point).
+        radius : float
+            Search radius.
+
+        Returns
+        -------
+        list
+            Indexes of points within radius of each query point (as
+            :class:`numpy.ndarray`, in order of increasing distance).
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self._tree is not None:
+            neighbours = self._tree.query_ball_point(points, radius)
+            results = []
+            for point, indexes in zip(points, neighbours):
+                indexes = np.asarray(indexes, dtype=np.int64)
+                squared = ((self.points[indexes] - point) ** 2).sum(axis=1)
+                results.append(indexes[np.argsort(squared,
+                                                  kind='mergesort')])
+            return results
+
+        results = []
+        for start in range(0, points.shape[0], self.chunk_size):
+            squared = self._squared_distances(points[start:start +
+                                                     self.chunk_size])
+            for squared_i in squared:
+                indexes = np.nonzero(squared_i <= radius * radius)[0]
+                results.append(indexes[np.argsort(squared_i[indexes],
+                                                  kind='mergesort')])
+        return results
+
+    def _squared_distances(self, points):
+        deltas = points[:, None, :] - self.points[None, :, :]
+        return (deltas * deltas).sum(axis=2)
@@ -0,0 +1,101 @@
+'''
+Electrode label images, to map image pixels (e.g., of a camera frame) to
+electrodes.
+'''
+import numpy as np
+
+
+def affine_matrix(transform):
+    '''
+    Parameters
+    ----------
+    transform : array-like
+        Affine transform as ``2x3`` or ``3x3`` matrix.
+
+    Returns
+    -------
+    numpy.ndarray
+        Affine transform as ``3x3`` matrix.
+    '''
+    transform = np.asarray(transform, dtype=float)
+    if transform.shape == (2, 3):
+        transform = np.vstack([transform, [0, 0, 1]])
+    elif transform.shape != (3, 3):
+        raise ValueError('Affine transform must be a 2x3 or 3x3 matrix.')
+    return transform
+
+
+def rasterize_labels(spatial_index, shape, transform, chunk_rows=None):
+    '''
+    Rasterize electrode polygons into an image of electrode codes.
+
+    Parameters
+    ----------
+    spatial_index : dmf_device.spatial.SpatialIndex
+        Spatial index of electrode polygons.
+    shape : tuple
+        ``(height, width)`` of image in pixels.
+    transform : array-like
+        Affine transform (``2x3`` or ``3x3`` matrix) from electrode
+        coordinates to pixel coordinates, where ``(x, y)`` is the center of
+        the pixel at column ``x`` and row ``y``.
+    chunk_rows : int, optional
+        Number of image rows to process at a time (default: enough rows for
+        about one million pixels).
+
+    Returns
+    -------
+    numpy.ndarray
+        Code of electrode at the center of each pixel, or -1 for pixels not
+        covered by an electrode.
+    '''
+    height, width = shape
+    inverse = np.linalg.inv(affine_matrix(transform))
+    dtype = np.int16 if spatial_index.vertex_indptr.shape[0] < (1 << 15) \
+        else np.int32
+    labels = np.empty((height, width), dtype=dtype)
+    if chunk_rows is None:
+        chunk_rows = max(1, (1 << 20) // max(width, 1))
+    columns = np.arange(width, dtype=float)
+    for start in range(0, height, chunk_rows):
+        rows = np.arange(start, min(start + chunk_rows, height), dtype=float)
+        pixels = np.column_stack([np.tile(columns, rows.shape[0]),
+                                  np.repeat(rows, width)])
+        points = pixels.dot(inverse[:2, :2].T) + inverse[:2, 2]
+        labels[start:start + rows.shape[0]] = \
+            spatial_index.find(points).reshape(rows.shape[0], width)
+    return labels
+
+
+def label_means(labels, image, label_count):
+    '''
+    Mean pixel value per electrode, e.g., of a camera frame.
+
+    Parameters
+    ----------
+    labels : numpy.ndarray
+        Electrode code of each pixel (see :func:`rasterize_labels`).
+    image : numpy.ndarray
+        Image with the same height and width as ``labels``.  Additional
+        dimensions (e.g., colour channels) are averaged separately.
+    label_count : int
+        Number of electrodes.
+
+    Returns
+    -------
+    numpy.ndarray
+        Mean value of pixels of each electrode (NaN for electrodes without
+        pixels), one row per electrode code.
+    '''
+    labels = labels.ravel()
+    covered = labels >= 0
+    labels = labels[covered]
+    image = np.asarray(image)
+    values = image.reshape(covered.shape[0], -1)[covered]
+    counts = np.bincount(labels, minlength=label_count)[:, None]
+    sums = np.column_stack([np.bincount(labels, weights=values[:, i],
+                                        minlength=label_count)
+                            for i in range(values.shape[1])])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    return means.reshape((label_count, ) + image.shape[2:])
@@ -0,0 +1,456 @@
+'''
+Shortest path search between electrodes on compact connection graphs.
+'''
+from collections import OrderedDict
+import heapq
+import math
+import multiprocessing
+
+import numpy as np
+
+from .graph import index_dtype
+
+
+class LruCache(object):
+    '''
+    Mapping that holds at most :attr:`maxsize` entries, discarding the least
+    recently used entry first.
+    '''
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        '''
+        Returns
+        -------
+        object
+            Value of entry, or :data:`default` if no entry exists for key.
+            An existing entry is marked as most recently used.
+        '''
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            return default
+        self._entries[key] = value
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def edge_lengths(coordinates, sources, targets):
+    '''
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        Coordinates of each node, one row per node code.
+    sources, targets : numpy.ndarray
+        Codes of edge end points.
+
+    Returns
+    -------
+    numpy.ndarray
+        Euclidean distance between end points of each edge.
+    '''
+    deltas = coordinates[targets] - coordinates[sources]
+    return np.sqrt((deltas * deltas).sum(axis=1))
+
+
+class AStarRouter(object):
+    '''
+    A* shortest path search on a :class:`dmf_device.graph.CsrGraph`, where
+    the cost of each edge is the Euclidean distance between the coordinates of
+    its end points (e.g., electrode centers).
+
+    The straight-line distance to the target is used as search heuristic.
+    Since no path can be shorter than the straight line, the heuristic is
+    admissible (and consistent), i.e., paths found are optimal.
+
+    Attributes
+    ----------
+    graph : dmf_device.graph.CsrGraph
+        Connection graph.
+    coordinates : numpy.ndarray
+        ``(x, y)`` coordinates of each node, one row per node code.
+    costs : numpy.ndarray
+        Cost of each neighbour entry in :attr:`graph` ``.indices``.
+    '''
+    def __init__(self, graph, coordinates):
+        self.graph = graph
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        sources = np.repeat(np.arange(graph.node_count), graph.degree())
+        self.costs = edge_lengths(self.coordinates, sources, graph.indices)
+        self._init_lists()
+
+    def _init_lists(self):
+        # Search loop is scalar, where Python lists are much faster to index
+        # than arrays.
+        self._indptr = self.graph.indptr.tolist()
+        self._indices = self.graph.indices.tolist()
+        self._costs = self.costs.tolist()
+        self._xy = self.coordinates.tolist()
+
+    def __getstate__(self):
+        # Lists are derived from arrays; do not store them twice.
+        return {'graph': self.graph, 'coordinates': self.coordinates,
+                'costs': self.costs}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_lists()
+
+    def shortest_path(self, source, target):
+        '''
+        Parameters
+        ----------
+        source, target : int
+            Codes of source and target nodes.
+
+        Returns
+        -------
+        list or None
+            Codes of nodes on shortest path from source to target, or ``None``
+            if target is not reachable from source.
+        '''
+        source, target = int(source), int(target)
+        if source == target:
+            return [source]
+        indptr, indices, costs, xy = (self._indptr, self._indices,
+                                      self._costs, self._xy)
+        target_x, target_y = xy[target]
+        x, y = xy[source]
+        distances = {source: 0.}
+        predecessors = {source: -1}
+        done = set()
+        # Entries are `(estimated total cost, -cost so far, node)`, i.e., ties
+        # are broken in favour of nodes closer to the target.
+        heap = [(math.hypot(x - target_x, y - target_y), 0., source)]
+        while heap:
+            estimate, distance, node = heapq.heappop(heap)
+            distance = -distance
+            if node == target:
+                return trace_path(predecessors, source, target)
+            if node in done:
+                continue
+            done.add(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[k]
+                distance_k = distance + costs[k]
+                if distance_k < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = distance_k
+                    predecessors[neighbour] = node
+                    x, y = xy[neighbour]
+                    heapq.heappush(heap, (distance_k +
+                                          math.hypot(x - target_x,
+                                                     y - target_y),
+                                          -distance_k, neighbour))
+        return None
+
+    def shortest_paths(self, source, targets):
+        '''
+        Find shortest paths from source to multiple targets using a single
+        Dijkstra search, which stops once all targets are reached.
+
+        Parameters
+        ----------
+        source : int
+            Code of source node.
+        targets : list
+            Codes of target nodes.
+
+        Returns
+        -------
+        list
+            Codes of nodes on shortest path from source to each target, or
+            ``None`` for each target not reachable from source.
+        '''
+        source = int(source)
+        targets = [int(target) for target in targets]
+        indptr, indices, costs = self._indptr, self._indices, self._costs
+        remaining = set(targets)
+        distances = {source: 0.}
+        predecessors = {source: -1}
+        done = set()
+        heap = [(0., source)]
+        while heap and remaining:
+            distance, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            remaining.discard(node)
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[k]
+                distance_k = distance + costs[k]
+                if distance_k < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = distance_k
+                    predecessors[neighbour] = node
+                    heapq.heappush(heap, (distance_k, neighbour))
+        return [trace_path(predecessors, source, target) if target in done
+                else None for target in targets]
+
+    def path_length(self, path):
+        '''
+        Parameters
+        ----------
+        path : list
+            Codes of nodes on path.
+
+        Returns
+        -------
+        float
+            Total cost of path.
+        '''
+        path = np.asarray(path, dtype=int)
+        if path.shape[0] < 2:
+            return 0.
+        return float(edge_lengths(self.coordinates, path[:-1], path[1:])
+                     .sum())
+
+
+def trace_path(predecessors, source, target):
+    '''
+    Parameters
+    ----------
+    predecessors : dict
+        Code of predecessor of each node reached from source.
+    source, target : int
+        Codes of source and target nodes.
+
+    Returns
+    -------
+    list
+        Codes of nodes on path from source to target.
+    '''
+    path = [target]
+    while path[-1] != source:
+        path.append(predecessors[path[-1]])
+    return path[::-1]
+
+
+def batch_shortest_paths(router, sources, targets, processes=1):
+    '''
+    Find shortest paths for multiple ``(source, target)`` queries.
+
+    Duplicate queries are answered once, and all queries from the same source
+    are answered by a single search (see :meth:`AStarRouter.shortest_paths`).
+
+    Parameters
+    ----------
+    router : AStarRouter
+        Router.
+    sources, targets : list
+        Codes of source and target node of each query.
+    processes : int, optional
+        Number of worker processes to search in (default: 1, i.e., search in
+        the current process).  If ``None``, use one process per CPU.  Each
+        worker receives a copy of the router once (rather than per search).
+
+    Returns
+    -------
+    list
+        Codes of nodes on shortest path for each query (in input order), or
+        ``None`` for each query where target is not reachable from source.
+    '''
+    sources = [int(source) for source in sources]
+    targets = [int(target) for target in targets]
+    if len(sources) != len(targets):
+        raise ValueError('Number of sources and targets differ.')
+
+    # Unique targets, grouped by source.
+    targets_by_source = OrderedDict()
+    for source, target in zip(sources, targets):
+        targets_by_source.setdefault(source, OrderedDict())[target] = None
+    tasks = [(source, list(targets_i))
+             for source, targets_i in targets_by_source.items()]
+
+    if processes == 1 or len(tasks) < 2:
+        results = [router.shortest_paths(*task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                    initargs=(router, ))
+        try:
+            results = pool.map(_worker_shortest_paths, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    paths = {}
+    for (source, targets_i), paths_i in zip(tasks, results):
+        for target, path in zip(targets_i, paths_i):
+            paths[(source, target)] = path
+    return [paths[(source, target)]
+            for source, target in zip(sources, targets)]
+
+
+# Router of worker process (see `batch_shortest_paths`).
+_worker_router = None
+
+
+def _init_worker(router):
+    global _worker_router
+
+    _worker_router = router
+
+
+def _worker_shortest_paths(task):
+    return _worker_router.shortest_paths(*task)
+
+
+class RoutingTable(object):
+    '''
+    All-pairs table of paths with the fewest hops between nodes of a
+    :class:`dmf_device.graph.CsrGraph`.
+
+    Among paths with the fewest hops, the path with the lowest total edge
+    cost is selected (if edge costs are specified).
+
+    Attributes
+    ----------
+    distances : numpy.ndarray
+        Number of hops from source (row) to target (column), or -1 if target
+        is not reachable from source.
+    predecessors : numpy.ndarray
+        Code of predecessor of target (column) on path from source (row), or
+        -1 if target is source or is not reachable from source.
+    '''
+    def __init__(self, distances, predecessors):
+        self.distances = distances
+        self.predecessors = predecessors
+
+    @property
+    def node_count(self):
+        return self.distances.shape[0]
+
+    @classmethod
+    def from_graph(cls, graph, costs=None, chunk_size=256):
+        '''
+        Build table using a breadth-first search from each node.
+
+        The searches from each chunk of source nodes run simultaneously, one
+        level at a time, using vectorized array operations.
+
+        Parameters
+        ----------
+        graph : dmf_device.graph.CsrGraph
+            Connection graph.
+        costs : numpy.ndarray, optional
+            Cost of each neighbour entry in ``graph.indices``, used to break
+            ties between paths with the same number of hops.
+        chunk_size : int, optional
+            Number of sources to search at a time (bounds memory use).
+
+        Returns
+        -------
+        RoutingTable
+        '''
+        node_count = graph.node_count
+        dtype = index_dtype(node_count)
+        distances = np.full((node_count, node_count), -1, dtype=dtype)
+        predecessors = np.full((node_count, node_count), -1, dtype=dtype)
+        for start in range(0, node_count, chunk_size):
+            sources = np.arange(start, min(start + chunk_size, node_count))
+            lengths = np.zeros((sources.shape[0], node_count))
+            rows = np.arange(sources.shape[0])
+            distances_i = distances[sources]
+            predecessors_i = predecessors[sources]
+            distances_i[rows, sources] = 0
+            nodes = sources
+            distance = 0
+            while nodes.shape[0] > 0:
+                distance += 1
+                positions, counts = graph.neighbor_positions(nodes)
+                neighbors = graph.indices[positions]
+                parents = np.repeat(nodes, counts)
+                rows = np.repeat(rows, counts)
+                unvisited = distances_i[rows, neighbors] < 0
+                neighbors = neighbors[unvisited]
+                parents = parents[unvisited]
+                rows = rows[unvisited]
+                candidate_lengths = lengths[rows, parents]
+                if costs is not None:
+                    candidate_lengths += costs[positions[unvisited]]
+                # Select parent with lowest path cost for each newly reached
+                # `(source, node)` pair.
+                keys = rows * node_count + neighbors
+                order = np.lexsort((candidate_lengths, keys))
+                keys = keys[order]
+                first = np.ones(keys.shape[0], dtype=bool)
+                first[1:] = keys[1:] != keys[:-1]
+                order = order[first]
+                rows, nodes = rows[order], neighbors[order]
+                distances_i[rows, nodes] = distance
+                predecessors_i[rows, nodes] = parents[order]
+                lengths[rows, nodes] = candidate_lengths[order]
+            distances[sources] = distances_i
+            predecessors[sources] = predecessors_i
+        return cls(distances, predecessors)
+
+    def distance(self, source, target):
+        '''
+        Returns
+        -------
+        int
+            Number of hops from source to target, or -1 if target is not
+            reachable from source.
+        '''
+        return int(self.distances[source, target])
+
+    def shortest_path(self, source, target):
+        '''
+        Parameters
+        ----------
+        source, target : int
+            Codes of source and target nodes.
+
+        Returns
+        -------
+        list or None
+            Codes of nodes on path from source to target, or ``None`` if
+            target is not reachable from source.
+        '''
+        if self.distances[source, target] < 0:
+            return None
+        predecessors = self.predecessors[source]
+        path = [int(target)]
+        while path[-1] != source:
+            path.append(int(predecessors[path[-1]]))
+        return path[::-1]
+
+    def save(self, output):
+        '''
+        Parameters
+        ----------
+        output : str or file-like
+            Output file path or file-like object (``.npz`` format).
+        '''
+        np.savez(output, distances=self.distances,
+                 predecessors=self.predecessors)
+
+    @classmethod
+    def load(cls, input_):
+        '''
+        Parameters
+        ----------
+        input_ : str or file-like
+            Input file path or file-like object (``.npz`` format, see
+            :meth:`save`).
+
+        Returns
+        -------
+        RoutingTable
+        '''
+        with np.load(input_) as data:
+            return cls(data['distances'], data['predecessors'])
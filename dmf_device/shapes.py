@@ -0,0 +1,99 @@
+'''
+Compact storage of electrode shape vertices.
+
+A shapes frame (see :func:`dmf_device.svg.shapes_to_df`) holds one row per
+polygon vertex, where the attributes of each shape (e.g., ``id`` and
+``data-channels``) are repeated on every vertex row.  :class:`CompactShapes`
+instead stores vertex coordinates as single precision arrays, grouped by shape
+using an offsets array (as in a compressed sparse row matrix), and stores the
+attributes of each shape *once*.
+'''
+import numpy as np
+
+
+class CompactShapes(object):
+    '''
+    Struct-of-arrays layout of a shapes frame.
+
+    Attributes
+    ----------
+    indptr : numpy.ndarray
+        Vertices of shape ``i`` are ``x[indptr[i]:indptr[i + 1]]`` and
+        ``y[indptr[i]:indptr[i + 1]]``.
+    x, y : numpy.ndarray
+        Vertex coordinates, concatenated in shape order.
+    df_attributes : pandas.DataFrame
+        Attributes of each shape (e.g., ``id``, ``data-channels``,
+        ``x_center``), one row per shape.
+    columns : list
+        Columns of the shapes frame, in order.
+    '''
+    #: Columns computed from other columns when building a shapes frame.
+    VERTEX_COLUMNS = ('vertex_i', 'x', 'y', 'x_center_offset',
+                      'y_center_offset')
+
+    def __init__(self, indptr, x, y, df_attributes, columns):
+        self.indptr = indptr
+        self.x = x
+        self.y = y
+        self.df_attributes = df_attributes
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df_shapes, dtype=np.float32):
+        '''
+        Parameters
+        ----------
+        df_shapes : pandas.DataFrame
+            Frame with one row per shape vertex, with the columns
+            ``vertex_i``, ``x`` and ``y``, where the rows of each shape are
+            contiguous and start with ``vertex_i`` of 0 (see
+            :func:`dmf_device.svg.shapes_to_df`).  All other columns must be
+            constant within each shape.
+        dtype : numpy.dtype, optional
+            Data type of vertex coordinates.
+
+        Returns
+        -------
+        CompactShapes
+        '''
+        vertex_i = df_shapes['vertex_i'].values
+        starts = np.nonzero(vertex_i == 0)[0]
+        if df_shapes.shape[0] and (starts.shape[0] == 0 or starts[0] != 0):
+            raise ValueError('Rows of each shape must start with `vertex_i` '
+                             'of 0.')
+        indptr = np.append(starts, df_shapes.shape[0]).astype(np.int64)
+        attribute_columns = [column for column in df_shapes.columns
+                             if column not in cls.VERTEX_COLUMNS]
+        df_attributes = (df_shapes[attribute_columns].iloc[starts]
+                         .reset_index(drop=True))
+        return cls(indptr, df_shapes['x'].values.astype(dtype),
+                   df_shapes['y'].values.astype(dtype), df_attributes,
+                   list(df_shapes.columns))
+
+    def __len__(self):
+        return self.indptr.shape[0] - 1
+
+    def to_frame(self):
+        '''
+        Returns
+        -------
+        pandas.DataFrame
+            Shapes frame, with one row per shape vertex (coordinates as double
+            precision) and the attributes of each shape repeated on every
+            vertex row of the shape.
+        '''
+        counts = np.diff(self.indptr)
+        shapes = np.repeat(np.arange(len(self)), counts)
+        df_shapes = (self.df_attributes.iloc[shapes]
+                     .reset_index(drop=True))
+        df_shapes['vertex_i'] = (np.arange(shapes.shape[0]) -
+                                 self.indptr[shapes])
+        df_shapes['x'] = self.x.astype(float)
+        df_shapes['y'] = self.y.astype(float)
+        for column in ('x', 'y'):
+            offset_column = '%s_center_offset' % column
+            if offset_column in self.columns:
+                df_shapes[offset_column] = (df_shapes[column] -
+                                            df_shapes['%s_center' % column])
+        return df_shapes[self.columns]
@@ -0,0 +1,235 @@
+'''
+Spatial index to find the electrode at each of a batch of points.
+'''
+import numpy as np
+
+from .geometry import next_vertices
+from .graph import concatenated_ranges, csr_positions
+
+
+def box_cells(cell_min, cell_max, grid_width):
+    '''
+    Expand each box to the grid cells it overlaps.
+
+    Parameters
+    ----------
+    cell_min, cell_max : numpy.ndarray
+        ``(column, row)`` of first and last grid cell overlapped by each box.
+    grid_width : int
+        Number of grid cells per row.
+
+    Returns
+    -------
+    (boxes, cells) : (numpy.ndarray, numpy.ndarray)
+        Index of box and (row-major) grid cell of each ``(box, cell)`` pair.
+    '''
+    widths = cell_max[:, 0] - cell_min[:, 0] + 1
+    counts = widths * (cell_max[:, 1] - cell_min[:, 1] + 1)
+    boxes = np.repeat(np.arange(cell_min.shape[0]), counts)
+    # Index of each cell within the cells of its box.
+    local = concatenated_ranges(np.zeros_like(counts), counts)
+    cells = ((cell_min[boxes, 1] + local // widths[boxes]) * grid_width +
+             cell_min[boxes, 0] + local % widths[boxes])
+    return boxes, cells
+
+
+class SpatialIndex(object):
+    '''
+    Uniform grid over electrode bounding boxes, with exact (even-odd rule)
+    point-in-polygon tests of the electrodes whose bounding box overlaps the
+    grid cell of each query point.
+
+    All queries are vectorized over points, candidate electrodes and polygon
+    edges.
+
+    Attributes
+    ----------
+    x, y : numpy.ndarray
+        Vertex coordinates of all electrode polygons, ordered by electrode
+        code.
+    vertex_indptr : numpy.ndarray
+        Offset of the vertices of each electrode in :attr:`x` and :attr:`y`
+        (length is number of electrodes + 1).
+    bounding_boxes : numpy.ndarray
+        ``(x_min, y_min, x_max, y_max)`` of each electrode.
+    origin : numpy.ndarray
+        ``(x, y)`` coordinates of the corner of the first grid cell.
+    cell_size : float
+        Width and height of each grid cell.
+    shape : tuple
+        Number of grid cells along ``(x, y)``.
+    cell_indptr, cell_electrodes : numpy.ndarray
+        Codes of electrodes with bounding box overlapping grid cell ``i``
+        are ``cell_electrodes[cell_indptr[i]:cell_indptr[i + 1]]``.
+    '''
+    def __init__(self, x, y, vertex_indptr, bounding_boxes=None,
+                 cells_per_electrode=1.):
+        '''
+        Parameters
+        ----------
+        x, y : numpy.ndarray
+            Vertex coordinates of all electrode polygons, ordered by electrode
+            code.
+        vertex_indptr : numpy.ndarray
+            Offset of the vertices of each electrode in ``x`` and ``y``.
+        bounding_boxes : numpy.ndarray, optional
+            Precomputed ``(x_min, y_min, x_max, y_max)`` of each electrode
+            (computed from vertices by default).
+        cells_per_electrode : float, optional
+            Approximate number of grid cells per electrode.
+        '''
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.vertex_indptr = np.asarray(vertex_indptr, dtype=np.int64)
+        electrode_count = self.vertex_indptr.shape[0] - 1
+        vertex_counts = np.diff(self.vertex_indptr)
+        self._next_vertex = next_vertices(self.vertex_indptr)
+
+        starts = self.vertex_indptr[:-1][vertex_counts > 0]
+        if bounding_boxes is not None:
+            self.bounding_boxes = np.asarray(bounding_boxes, dtype=float)
+        else:
+            self.bounding_boxes = np.full((electrode_count, 4), np.nan)
+        if bounding_boxes is None and starts.shape[0]:
+            self.bounding_boxes[vertex_counts > 0] = np.column_stack(
+                [np.minimum.reduceat(self.x, starts),
+                 np.minimum.reduceat(self.y, starts),
+                 np.maximum.reduceat(self.x, starts),
+                 np.maximum.reduceat(self.y, starts)])
+        self._init_grid(cells_per_electrode)
+
+    @classmethod
+    def from_frame(cls, df_shapes, codes, **kwargs):
+        '''
+        Parameters
+        ----------
+        df_shapes : pandas.DataFrame
+            Frame with one row per electrode polygon vertex, with the columns
+            ``x`` and ``y``, ordered by vertex within each electrode.
+        codes : array-like
+            Electrode code of each row of ``df_shapes`` (-1 to ignore row).
+        **kwargs
+            Keyword arguments passed to :meth:`__init__`.
+
+        Returns
+        -------
+        SpatialIndex
+        '''
+        codes = np.asarray(codes)
+        valid = codes >= 0
+        codes = codes[valid]
+        order = np.argsort(codes, kind='mergesort')
+        electrode_count = codes.max() + 1 if codes.shape[0] else 0
+        vertex_indptr = np.zeros(electrode_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=electrode_count),
+                  out=vertex_indptr[1:])
+        return cls(df_shapes['x'].values[valid][order],
+                   df_shapes['y'].values[valid][order], vertex_indptr,
+                   **kwargs)
+
+    def _init_grid(self, cells_per_electrode):
+        boxes = self.bounding_boxes[~np.isnan(self.bounding_boxes[:, 0])]
+        if boxes.shape[0] == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.
+            self.shape = (0, 0)
+            self.cell_indptr = np.zeros(1, dtype=np.int64)
+            self.cell_electrodes = np.zeros(0, dtype=np.int64)
+            return
+        self.origin = boxes[:, :2].min(axis=0)
+        extent = boxes[:, 2:].max(axis=0) - self.origin
+        area = max(extent[0] * extent[1], 1e-12)
+        self.cell_size = max(np.sqrt(area / (cells_per_electrode *
+                                             boxes.shape[0])),
+                             1e-6 * max(extent.max(), 1.))
+        self.shape = tuple(int(v) for v in
+                           np.floor(extent / self.cell_size) + 1)
+
+        # Grid cell range overlapped by each electrode bounding box.
+        electrodes = np.nonzero(~np.isnan(self.bounding_boxes[:, 0]))[0]
+        cell_min = self._cell_coordinates(self.bounding_boxes[electrodes, :2])
+        cell_max = self._cell_coordinates(self.bounding_boxes[electrodes, 2:])
+        entry_electrodes, cells = box_cells(cell_min, cell_max,
+                                            self.shape[0])
+        order = np.argsort(cells, kind='mergesort')
+        self.cell_electrodes = electrodes[entry_electrodes[order]]
+        self.cell_indptr = np.zeros(self.shape[0] * self.shape[1] + 1,
+                                    dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.cell_indptr.shape[0] -
+                              1), out=self.cell_indptr[1:])
+
+    def _cell_coordinates(self, points):
+        cells = np.floor((points - self.origin) /
+                         self.cell_size).astype(np.int64)
+        return np.minimum(np.maximum(cells, 0), np.array(self.shape) - 1)
+
+    def find(self, points, chunk_size=1 << 16):
+        '''
+        Find electrode containing each point.
+
+        Parameters
+        ----------
+        points : array-like
+            ``(x, y)`` coordinates of each point (one row per point).
+        chunk_size : int, optional
+            Number of points to process at a time (bounds memory use).
+
+        Returns
+        -------
+        numpy.ndarray
+            Code of electrode containing each point, or -1 for points not
+            contained in any electrode.  If multiple electrodes contain a
+            point, the electrode with the lowest code is selected.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        codes = np.full(points.shape[0], -1, dtype=np.int64)
+        for start in range(0, points.shape[0], chunk_size):
+            end = min(start + chunk_size, points.shape[0])
+            codes[start:end] = self._find(points[start:end])
+        return codes
+
+    def _find(self, points):
+        codes = np.full(points.shape[0], -1, dtype=np.int64)
+        if self.cell_electrodes.shape[0] == 0 or points.shape[0] == 0:
+            return codes
+        extent = np.array(self.shape) * self.cell_size
+        in_grid = ((points >= self.origin) &
+                   (points <= self.origin + extent)).all(axis=1)
+        point_ids = np.nonzero(in_grid)[0]
+        cells = self._cell_coordinates(points[point_ids])
+        cells = cells[:, 1] * self.shape[0] + cells[:, 0]
+
+        # Candidate `(point, electrode)` pairs from grid cell of each point.
+        positions, counts = csr_positions(self.cell_indptr, cells)
+        pair_points = np.repeat(point_ids, counts)
+        pair_electrodes = self.cell_electrodes[positions]
+        px, py = points[pair_points, 0], points[pair_points, 1]
+        boxes = self.bounding_boxes[pair_electrodes]
+        in_box = ((px >= boxes[:, 0]) & (py >= boxes[:, 1]) &
+                  (px <= boxes[:, 2]) & (py <= boxes[:, 3]))
+        pair_points, pair_electrodes = (pair_points[in_box],
+                                        pair_electrodes[in_box])
+        px, py = px[in_box], py[in_box]
+
+        # Even-odd rule: count crossings of horizontal ray from each point
+        # with the edges of the candidate electrode.
+        vertices, vertex_counts = csr_positions(self.vertex_indptr,
+                                                pair_electrodes)
+        edge_pairs = np.repeat(np.arange(pair_points.shape[0]), vertex_counts)
+        x1, y1 = self.x[vertices], self.y[vertices]
+        following = self._next_vertex[vertices]
+        x2, y2 = self.x[following], self.y[following]
+        ex, ey = px[edge_pairs], py[edge_pairs]
+        straddles = (y1 > ey) != (y2 > ey)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (ey - y1) * (x2 - x1) / (y2 - y1)
+        crossings = np.bincount(edge_pairs[straddles & (ex < x_cross)],
+                                minlength=pair_points.shape[0])
+        inside = crossings % 2 == 1
+
+        # Assign in order of descending code, such that the lowest code wins.
+        pair_points = pair_points[inside]
+        pair_electrodes = pair_electrodes[inside]
+        order = np.argsort(-pair_electrodes, kind='mergesort')
+        codes[pair_points[order]] = pair_electrodes[order]
+        return codes
@@ -0,0 +1,305 @@
+'''
+Helpers to read device data from a *parsed* SVG document.
+
+The functions in this module correspond to :func:`svg_model.svg_shapes_to_df`
+and :func:`svg_model.connections.extract_connections`, but operate on an
+``lxml`` element tree instead of an SVG source.  This allows the SVG document
+of a device to be parsed exactly once and shared between the electrode layer,
+the connection layer and serialization (see :meth:`DmfDevice.to_svg`).
+'''
+import re
+import warnings
+
+from lxml import etree
+from svg_model import INKSCAPE_NSMAP, cre_path_command
+import pandas as pd
+
+
+# Regular expression pattern to match start and end coordinates of a
+# connection `svg:path` element.
+cre_path_ends = re.compile(r'^\s*M\s*(?P<start_x>\d+(\.\d+)?),\s*'
+                           r'(?P<start_y>\d+(\.\d+)?).*L\s*'
+                           r'(?P<end_x>\d+(\.\d+)?),\s*'
+                           r'(?P<end_y>\d+(\.\d+)?)\D*$')
+
+
+def parse_svg(svg_source):
+    '''
+    Parameters
+    ----------
+    svg_source : str or file-like
+        A file path, URI, or file-like object.
+
+    Returns
+    -------
+    lxml.etree._ElementTree
+        Parsed SVG document.
+    '''
+    return etree.parse(svg_source)
+
+
+def shapes_to_df(xml_tree, xpath='//svg:path | //svg:polygon',
+                 namespaces=INKSCAPE_NSMAP):
+    '''
+    Construct a data frame with one row per vertex for all shapes in parsed
+    SVG document.
+
+    See :func:`svg_model.svg_shapes_to_df`.
+
+    Parameters
+    ----------
+    xml_tree : lxml.etree._ElementTree
+        Parsed SVG document.
+    xpath : str, optional
+        XPath path expression to select shape nodes.
+    namespaces : dict, optional
+        Key/value mapping of XML namespaces.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Frame with one row per vertex for all selected shapes, with the
+        columns ``vertex_i``, ``x``, ``y`` and one column per attribute of
+        the SVG shape elements (e.g., ``id``, ``data-channels``, etc.).
+    '''
+    shapes = xml_tree.xpath(xpath, namespaces=namespaces)
+
+    # Get list of attributes that are set in any of the shapes (not including
+    # the `svg:path` `"d"` attribute or the `svg:polygon` `"points"`
+    # attribute).
+    attribs_set = set()
+    for shape_i in shapes:
+        attribs_set.update(shape_i.attrib.keys())
+    attribs_set.difference_update(('d', 'points'))
+    attribs_set.discard('id')
+    # Always add 'id' attribute as first attribute.
+    attribs = ['id'] + sorted(attribs_set)
+
+    frames = []
+    for shape_i in shapes:
+        base_fields = [shape_i.attrib.get(k, None) for k in attribs]
+
+        if shape_i.tag == '{http://www.w3.org/2000/svg}path':
+            points_i = [base_fields + [i, float(m.group('x')),
+                                       float(m.group('y'))]
+                        for i, m in enumerate(cre_path_command
+                                              .finditer(shape_i.attrib['d']))]
+        elif shape_i.tag == '{http://www.w3.org/2000/svg}polygon':
+            points_i = [base_fields + [i] + [float(v_j)
+                                             for v_j in v.split(',')]
+                        for i, v in enumerate(shape_i.attrib['points']
+                                              .strip().split(' '))]
+        else:
+            warnings.warn('Unsupported shape tag type: %s' % shape_i.tag)
+            continue
+        frames.extend(points_i)
+    if not frames:
+        # There were no shapes found, so set `frames` list to `None` to allow
+        # an empty data frame to be created.
+        frames = None
+    return pd.DataFrame(frames, columns=attribs + ['vertex_i', 'x', 'y'])
+
+
+def connection_lines_to_df(xml_tree, line_layer='Connections',
+                           line_xpath=None, path_xpath=None,
+                           namespaces=INKSCAPE_NSMAP):
+    '''
+    Load end points of all ``<svg:line>`` elements and ``<svg:path>`` elements
+    from a layer of a parsed SVG document.
+
+    Parameters
+    ----------
+    xml_tree : lxml.etree._ElementTree
+        Parsed SVG document.
+    line_layer : str, optional
+        Name of layer in SVG containing connection lines.
+    line_xpath : str, optional
+        XPath string to iterate through connection lines.
+    path_xpath : str, optional
+        XPath string to iterate through connection paths.
+    namespaces : dict, optional
+        Key/value mapping of XML namespaces.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per connection line, with the columns ``id``, ``x1``, ``y1``,
+        ``x2`` and ``y2``.
+    '''
+    if line_xpath is None:
+        line_xpath = "//svg:g[@inkscape:label='%s']/svg:line" % line_layer
+    if path_xpath is None:
+        path_xpath = "//svg:g[@inkscape:label='%s']/svg:path" % line_layer
+
+    # List of records of form: `[<id>, <x1>, <y1>, <x2>, <y2>]`.
+    frames = []
+    for line_i in xml_tree.xpath(line_xpath, namespaces=namespaces):
+        frames.append([line_i.attrib.get('id', None)] +
+                      [float(line_i.attrib[k])
+                       for k in ('x1', 'y1', 'x2', 'y2')])
+
+    for path_i in xml_tree.xpath(path_xpath, namespaces=namespaces):
+        match_i = cre_path_ends.match(path_i.attrib['d'])
+        if match_i:
+            frames.append([path_i.attrib.get('id', None)] +
+                          [float(match_i.group(k))
+                           for k in ('start_x', 'start_y', 'end_x',
+                                     'end_y')])
+    if not frames:
+        frames = None
+    return pd.DataFrame(frames, columns=['id', 'x1', 'y1', 'x2', 'y2'])
+
+
+def find_connected_shapes(df_connection_lines, shapes_canvas):
+    '''
+    Parameters
+    ----------
+    df_connection_lines : pandas.DataFrame
+        Connection line end points, as returned by
+        :func:`connection_lines_to_df`.
+    shapes_canvas : svg_model.shapes_canvas.ShapesCanvas
+        Shapes canvas containing shapes to compare against connection
+        endpoints.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Each row corresponds to connection between two shapes in
+        :data:`shapes_canvas`, denoted ``source`` and ``target``, where both
+        end points of a connection line overlap a shape.
+    '''
+    if df_connection_lines.shape[0] == 0:
+        return pd.DataFrame(None, columns=['source', 'target'])
+
+    df_shape_connections = pd.DataFrame([[shapes_canvas.find_shape(x1, y1),
+                                          shapes_canvas.find_shape(x2, y2)]
+                                         for x1, y1, x2, y2 in
+                                         df_connection_lines[['x1', 'y1', 'x2',
+                                                              'y2']].values],
+                                        columns=['source', 'target'])
+    df_shape_connections['line_id'] = df_connection_lines['id'].values
+    return df_shape_connections.dropna()
+
+
+def extract_connections(xml_tree, shapes_canvas, **kwargs):
+    '''
+    Load all ``<svg:line>`` elements and ``<svg:path>`` elements from a layer
+    of a parsed SVG document.  For each element, if endpoints overlap distinct
+    shapes in :data:`shapes_canvas`, add connection between overlapped shapes.
+
+    See :func:`svg_model.connections.extract_connections`.
+
+    Parameters
+    ----------
+    xml_tree : lxml.etree._ElementTree
+        Parsed SVG document.
+    shapes_canvas : svg_model.shapes_canvas.ShapesCanvas
+        Shapes canvas containing shapes to compare against connection
+        endpoints.
+    **kwargs
+        Keyword arguments passed to :func:`connection_lines_to_df`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Each row corresponds to connection between two shapes in
+        :data:`shapes_canvas`, denoted ``source`` and ``target``.
+    '''
+    return find_connected_shapes(connection_lines_to_df(xml_tree, **kwargs),
+                                 shapes_canvas)
+
+
+def index_shapes(xml_tree, xpath='//svg:path | //svg:polygon',
+                 namespaces=INKSCAPE_NSMAP):
+    '''
+    Parameters
+    ----------
+    xml_tree : lxml.etree._ElementTree
+        Parsed SVG document.
+    xpath : str, optional
+        XPath path expression to select shape nodes.
+    namespaces : dict, optional
+        Key/value mapping of XML namespaces.
+
+    Returns
+    -------
+    dict
+        Selected shape elements (list), keyed by ``id`` attribute.
+    '''
+    elements = {}
+    for shape_i in xml_tree.xpath(xpath, namespaces=namespaces):
+        shape_id = shape_i.attrib.get('id')
+        if shape_id is not None:
+            elements.setdefault(shape_id, []).append(shape_i)
+    return elements
+
+
+class ChannelsDocument(object):
+    '''
+    Parsed SVG document where the ``data-channels`` attribute of electrode
+    shapes is kept in sync with modified electrode channel lists.
+
+    Shapes are looked up in an index built once per document (see
+    :func:`index_shapes`), and only shapes of electrodes whose channel lists
+    have changed since the previous :meth:`update` are modified.  Electrodes
+    no longer modified are restored to their original attributes, such that
+    the document may be reused for successive saves.
+    '''
+    def __init__(self, xml_tree, xpath='//svg:path | //svg:polygon',
+                 namespaces=INKSCAPE_NSMAP):
+        '''
+        Parameters
+        ----------
+        xml_tree : lxml.etree._ElementTree
+            Parsed SVG document (in the state of the source file).
+        xpath : str, optional
+            XPath path expression to select electrode shape nodes.
+        namespaces : dict, optional
+            Key/value mapping of XML namespaces.
+        '''
+        self.xml_tree = xml_tree
+        self.elements = index_shapes(xml_tree, xpath=xpath,
+                                     namespaces=namespaces)
+        # Original `data-channels` attribute of each shape of each modified
+        # electrode (`None` if attribute is not set).
+        self._original = {}
+        # `data-channels` attribute written for each modified electrode.
+        self._written = {}
+
+    def update(self, electrode_channels):
+        '''
+        Parameters
+        ----------
+        electrode_channels : dict
+            Channel list of *each* electrode whose channels differ from the
+            source file, keyed by electrode identifier.
+
+        Returns
+        -------
+        lxml.etree._ElementTree
+            Updated SVG document.
+        '''
+        for electrode_id in [electrode_id for electrode_id in self._written
+                             if electrode_id not in electrode_channels]:
+            elements = self.elements.get(electrode_id, [])
+            for element_i, value_i in zip(elements,
+                                          self._original.pop(electrode_id)):
+                if value_i is None:
+                    element_i.attrib.pop('data-channels', None)
+                else:
+                    element_i.attrib['data-channels'] = value_i
+            del self._written[electrode_id]
+
+        for electrode_id, channels in electrode_channels.items():
+            value = ','.join(map(str, channels))
+            if self._written.get(electrode_id) == value:
+                continue
+            elements = self.elements.get(electrode_id, [])
+            if electrode_id not in self._original:
+                self._original[electrode_id] = \
+                    [element_i.attrib.get('data-channels')
+                     for element_i in elements]
+            for element_i in elements:
+                element_i.attrib['data-channels'] = value
+            self._written[electrode_id] = value
+        return self.xml_tree
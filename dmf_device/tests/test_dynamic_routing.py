@@ -0,0 +1,44 @@
+import numpy as np
+
+from dmf_device.dynamic_routing import INF, LpaStar
+from dmf_device.graph import CsrGraph
+
+
+def grid_search(source, target, size=12, pitch=22 * 25.4 / 96):
+    '''
+    Search on square grid of electrodes, where node ``i * size + j`` is the
+    electrode in column ``i`` and row ``j``.
+    '''
+    codes = np.arange(size * size).reshape(size, size)
+    sources = np.concatenate([codes[:-1].ravel(), codes[:, :-1].ravel()])
+    targets = np.concatenate([codes[1:].ravel(), codes[:, 1:].ravel()])
+    graph = CsrGraph.from_edges(sources, targets, size * size)
+    coordinates = pitch * np.column_stack([codes.ravel() // size,
+                                           codes.ravel() % size])
+    return LpaStar(graph, coordinates, source, target)
+
+
+def test_shortest_path():
+    lpa_star = grid_search(0, 35)
+    path = lpa_star.shortest_path()
+    assert path[0] == 0 and path[-1] == 35
+    # Manhattan distance between electrodes in columns 0 and 2, rows 0 and
+    # 11, respectively.
+    assert len(path) == 14
+    assert np.isclose(lpa_star.path_cost(), 13 * 22 * 25.4 / 96)
+
+
+def test_source_cut_off():
+    # Path costs through the grid are equal in exact arithmetic, but not in
+    # floating point, which previously stopped the repair before the cost
+    # of the target was raised (and path reconstruction never terminated).
+    lpa_star = grid_search(0, 35)
+    assert lpa_star.shortest_path() is not None
+    lpa_star.set_nodes_blocked([1, 12])
+    assert lpa_star.shortest_path() is None
+    assert lpa_star.path_cost() == INF
+
+    lpa_star.set_nodes_blocked([12], blocked=False)
+    path = lpa_star.shortest_path()
+    assert path[:2] == [0, 12] and path[-1] == 35
+    assert 1 not in path